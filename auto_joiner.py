@@ -1,11 +1,24 @@
+import argparse
+import heapq
+import itertools
 import json
+import math
+import multiprocessing
+import os
 import random
 import re
+import subprocess
+import sys
 import time
-from datetime import datetime
-from threading import Timer
-import playsound
-import ctypes
+import urllib.request
+from bisect import bisect_right
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from datetime import date, datetime, timedelta, timezone
+from functools import lru_cache, wraps
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from threading import Lock, Thread, get_ident
+from urllib3.exceptions import HTTPError as DriverConnectionError
 
 from selenium import webdriver
 from selenium.common import exceptions
@@ -13,60 +26,475 @@ from selenium.webdriver.common.by import By
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.common.keys import Keys
-from webdriver_manager.chrome import ChromeDriverManager
-from webdriver_manager.utils import ChromeType
-from webdriver_manager.microsoft import EdgeChromiumDriverManager
-from msedge.selenium_tools import Edge, EdgeOptions
 
 browser: webdriver.Chrome = None
 config = None
+blacklist_meeting_patterns = []
+whitelist_meeting_patterns = []
+auto_leave_blacklist_patterns = []
+blacklist_schedule_rules = []  # (weekdays, minute from, minute to, title pattern) of each blacklist_schedule rule
 meetings = []
+calendar_index = {}  # meetings in today's calendar by id
+calendar_day = None  # date the meetings in calendar_index belong to
 current_meeting = None
-already_joined_ids = []
-hangup_thread: Timer = None
+already_joined_ids = set()
+joined_day = None  # date the entries in already_joined_ids belong to
 join_early_offset = 0
+join_deadlines = []  # heap of (join time, meeting id) for the upcoming meetings
+last_scan_time = 0  # unix time of the last calendar scan, which handled the join deadlines before it
+join_delays = {}  # random join delay in seconds chosen for each meeting id
+leave_at = None  # unix time to leave the current meeting at
+member_history = None  # member counts of the current meeting
+join_urls = {}  # join page URL of each meeting id, resolved before the meeting starts
+last_resource_usage = None  # (unix time, page busy seconds, process CPU seconds) of the last resource usage report
+
+metrics = {}  # count, durations and timeouts of each instrumented call, by name
+metrics_file = None  # file the individual calls are written to as JSON lines
+metrics_lock = Lock()  # guards metrics and metrics_file, which the metrics web server reads from its own thread
+
+# Upper bounds in seconds of the latency histogram buckets
+METRIC_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 2, 5, 10, 30, 60)
+
+DRIVER_CACHE_FILE = "driver_cache.json"
+
+# Seconds to wait for a single WebDriver command, like loading a page, before the browser is restarted
+DRIVER_COMMAND_TIMEOUT = 180
+# Seconds to wait for the browser to close before its processes are killed
+QUIT_TIMEOUT = 15
 
 class Meeting:
-    def __init__(self, m_id, time_started, title):
+    __slots__ = ("m_id", "time_started", "time_ended", "title", "url", "blacklisted", "auto_leave_blacklisted")
+
+    def __init__(self, m_id, time_started, title, time_ended=None, url=None):
         self.m_id = m_id
         self.time_started = time_started
+        self.time_ended = time_ended
         self.title = title
-        self.blacklisted = self.check_blacklist_calendar_meeting()
-        self.auto_leave_blacklisted = self.check_blacklist_auto_leave()
+        self.url = url
+        self.blacklisted, self.auto_leave_blacklisted = check_blacklist(title, time_started)
+
+    def __str__(self):
+        bl = " [BLACKLISTED]" if self.blacklisted else ""
+        joined = " [Already Joined]" if self.m_id in already_joined_ids else ""
+        return f"\t{self.title} {self.time_started}{bl}{joined}"
 
-    def check_blacklist_calendar_meeting(self):
-        if self.title is None:
+
+@lru_cache(maxsize=1024)
+def check_blacklist(title, time_started=None):
+    # Returns whether a meeting is blacklisted and whether it is auto leave blacklisted
+    if title is None:
+        return True, True
+    blacklisted = any(pattern.search(title) for pattern in blacklist_meeting_patterns)
+    if len(whitelist_meeting_patterns) > 0 and not any(pattern.search(title) for pattern in whitelist_meeting_patterns):
+        blacklisted = True
+    if time_started is not None and check_blacklist_schedule(title, datetime.fromtimestamp(time_started)):
+        blacklisted = True
+    auto_leave_blacklisted = any(pattern.search(title) for pattern in auto_leave_blacklist_patterns)
+    return blacklisted, auto_leave_blacklisted
+
+
+def check_blacklist_schedule(title, start):
+    # Checks if a meeting starting at the given time matches one of the blacklist_schedule rules.
+    # A rule whose from is after its to runs past midnight, into the day after each of its days
+    minute = start.hour * 60 + start.minute
+    weekday = start.weekday()
+    for weekdays, minute_from, minute_to, pattern in blacklist_schedule_rules:
+        if minute_from <= minute_to:
+            matches = weekday in weekdays and minute_from <= minute < minute_to
+        else:
+            matches = ((weekday in weekdays and minute >= minute_from) or
+                       ((weekday - 1) % 7 in weekdays and minute < minute_to))
+        if matches and (pattern is None or pattern.search(title)):
             return True
-        if "blacklist_meeting_re" in config and config['blacklist_meeting_re'] != "":
-            regex = config['blacklist_meeting_re']
-            return True if re.search(regex, self.title) else False
-        return False
+    return False
+
+
+def compile_patterns(key):
+    # Compiles the regex, or list of regexes, in a config entry
+    patterns = config[key] if key in config else []
+    if isinstance(patterns, str):
+        patterns = [patterns]
+    if not isinstance(patterns, list) or not all(isinstance(pattern, str) for pattern in patterns):
+        raise ValueError(f"{key} must be a regular expression or a list of them: {patterns!r}")
+    return [re.compile(pattern) for pattern in patterns if pattern != ""]
+
+
+WEEKDAYS = ["mon", "tue", "wed", "thu", "fri", "sat", "sun"]
+
+
+def parse_schedule_minute(text):
+    # Minute of the day of a 24h time like "13:30". "24:00" is the end of the day
+    if text == "24:00":
+        return 24 * 60
+    parsed = datetime.strptime(text, "%H:%M")
+    return parsed.hour * 60 + parsed.minute
+
 
-    def check_blacklist_auto_leave(self):
-        if self.title is None:
+def compile_schedule_rules():
+    # Reads the blacklist_schedule rules, like {"days": ["Mon", "Fri"], "from": "12:00", "to": "13:00", "title_re": ""}
+    rules = []
+    if not isinstance(config.get('blacklist_schedule', []), list):
+        raise ValueError(f"blacklist_schedule must be a list of rules: {config['blacklist_schedule']!r}")
+    for rule in config['blacklist_schedule'] if "blacklist_schedule" in config else []:
+        try:
+            weekdays = {WEEKDAYS.index(day[:3].lower()) for day in rule.get('days', WEEKDAYS)}
+            minute_from = parse_schedule_minute(rule.get('from', "00:00"))
+            minute_to = parse_schedule_minute(rule.get('to', "24:00"))
+        except (AttributeError, TypeError, ValueError) as e:
+            raise ValueError(f"invalid blacklist_schedule rule {rule}: {e}")
+        pattern = re.compile(rule['title_re']) if rule.get('title_re', "") != "" else None
+        rules.append((weekdays, minute_from, minute_to, pattern))
+    return rules
+
+
+class SessionError(Exception):
+    # Raised when Teams stops working in the browser and the browser has to be restarted
+    pass
+
+
+class MemberHistory:
+    # Keeps the recent member counts of a meeting and decides when to leave it
+    def __init__(self, leave_count, samples=1, peak_percent=0, drop_count=0, window=10):
+        self.leave_count = leave_count
+        self.samples = samples
+        self.peak_percent = peak_percent
+        self.drop_count = drop_count
+        self.counts = deque(maxlen=max(window, 2))
+        self.peak = 0
+        self.below = 0  # number of samples in a row at or below the leave limit
+        self.limit = leave_count  # member count at or below which the rule that decided to leave applies
+
+    def add(self, count):
+        # Adds a member count and returns True if the meeting should be left
+        if not count:
+            # Ignore failed reads of the participant list
+            return False
+        self.counts.append(count)
+        self.peak = max(self.peak, count)
+
+        # Leave below the fixed count, or below a percentage of the largest count seen
+        limit = self.leave_count
+        if self.peak_percent > 0:
+            limit = max(limit, self.peak * self.peak_percent / 100)
+        self.below = self.below + 1 if count <= limit else 0
+        if self.below >= self.samples:
+            self.limit = limit
+            return True
+
+        # Leave if many people left within the window
+        if self.drop_count > 0 and self.counts[0] - count >= self.drop_count:
+            self.limit = self.counts[0] - self.drop_count
             return True
-        if "auto_leave_blacklist_re" in config and config['auto_leave_blacklist_re'] != "":
-            regex = config['auto_leave_blacklist_re']
-            return True if re.search(regex, self.title) else False
         return False
 
-    def __str__(self):
-        bl = " [BLACKLISTED]" if self.blacklisted else ""
-        joined = " [Already Joined]" if self.m_id in already_joined_ids else ""
-        return f"\t{self.title} {self.time_started}{bl}{joined}"
+    def add_repeated(self, count, times):
+        # Adds the same member count several times. Returns the number added before the one that decided to leave,
+        # or None. Once the window only holds this count, adding more of it does not change anything
+        for i in range(min(times, self.counts.maxlen + self.samples)):
+            if self.add(count):
+                return i
+        return None
+
 
+def new_member_history(settings=None):
+    # Builds the auto leave rules from the config, or from the given settings
+    if settings is None:
+        settings = config
 
-def load_config():
-    global config
-    with open('config.json') as json_data_file:
+    # Maximum number of people in meeting to automatically leave
+    auto_leave_count = 7
+    if "auto_leave_count" in settings and settings['auto_leave_count'] > 1:
+        auto_leave_count = settings['auto_leave_count']
+
+    # Number of checks in a row that must be below the limit before leaving
+    samples = 1
+    if "auto_leave_samples" in settings and settings['auto_leave_samples'] > 1:
+        samples = settings['auto_leave_samples']
+
+    # Percentage of the largest member count to leave at
+    peak_percent = 0
+    if "auto_leave_peak_percent" in settings and settings['auto_leave_peak_percent'] > 0:
+        peak_percent = settings['auto_leave_peak_percent']
+
+    # Number of people leaving within auto_leave_drop_window checks to leave at
+    drop_count = 0
+    if "auto_leave_drop_count" in settings and settings['auto_leave_drop_count'] > 0:
+        drop_count = settings['auto_leave_drop_count']
+    drop_window = 10
+    if "auto_leave_drop_window" in settings and settings['auto_leave_drop_window'] > 1:
+        drop_window = settings['auto_leave_drop_window']
+
+    return MemberHistory(auto_leave_count, samples, peak_percent, drop_count, drop_window)
+
+
+def load_config(path='config.json'):
+    global config, blacklist_meeting_patterns, whitelist_meeting_patterns, auto_leave_blacklist_patterns, \
+        blacklist_schedule_rules
+    with open(path) as json_data_file:
         config = json.load(json_data_file)
+    if not isinstance(config, dict):
+        raise ValueError("the config must be a JSON object with the settings")
+
+    blacklist_meeting_patterns = compile_patterns('blacklist_meeting_re')
+    whitelist_meeting_patterns = compile_patterns('whitelist_meeting_re')
+    auto_leave_blacklist_patterns = compile_patterns('auto_leave_blacklist_re')
+    blacklist_schedule_rules = compile_schedule_rules()
+    check_blacklist.cache_clear()
+
+
+def get_joined_file():
+    # File that keeps the ids of meetings joined today across restarts
+    if "joined_file" in config and config['joined_file'] != "":
+        return config['joined_file']
+    return "joined_meetings.txt"
+
+
+def load_joined_ids():
+    # Loads the meetings already joined today and drops entries from previous days
+    global joined_day
+    joined_day = date.today()
+    already_joined_ids.clear()
+    try:
+        with open(get_joined_file()) as joined_file:
+            for line in joined_file:
+                day, _, m_id = line.rstrip("\n").partition("\t")
+                if day == joined_day.isoformat() and m_id != "":
+                    already_joined_ids.add(m_id)
+    except FileNotFoundError:
+        pass
+
+    # Rewrite the file so it only contains today's entries
+    with open(get_joined_file(), "w") as joined_file:
+        for m_id in already_joined_ids:
+            joined_file.write(f"{joined_day.isoformat()}\t{m_id}\n")
+
+
+def expire_joined_ids():
+    # Forgets the joined meetings once the day is over
+    if joined_day != date.today():
+        load_joined_ids()
+
+
+def mark_joined(m_id):
+    # Remembers a joined meeting, in memory and on disk
+    expire_joined_ids()
+    if m_id is None or m_id in already_joined_ids:
+        return
+    already_joined_ids.add(m_id)
+    with open(get_joined_file(), "a") as joined_file:
+        joined_file.write(f"{joined_day.isoformat()}\t{m_id}\n")
+
+
+def print_phase_time(phase, phase_start):
+    # Prints how long a startup phase took
+    print(f"{phase} took {time.time() - phase_start:.1f}s")
+
+
+def install_driver(chrome_type):
+    # Downloads the driver matching the installed browser, if needed
+    if chrome_type == "chromium":
+        from webdriver_manager.chrome import ChromeDriverManager
+        from webdriver_manager.utils import ChromeType
+        return ChromeDriverManager(chrome_type=ChromeType.CHROMIUM).install()
+    elif chrome_type == "msedge":
+        from webdriver_manager.microsoft import EdgeChromiumDriverManager
+        return EdgeChromiumDriverManager().install()
+    from webdriver_manager.chrome import ChromeDriverManager
+    return ChromeDriverManager().install()
+
+
+class DriverThread:
+    # Runs the commands of one browser on a single worker thread, so calls from different threads never
+    # overlap and a hung browser can be given up on. Commands of a restarted browser get a new thread
+    def __init__(self, execute):
+        self.execute = execute
+        self.worker = None
+        self.executor = ThreadPoolExecutor(max_workers=1, initializer=self.set_worker)
+
+    def set_worker(self):
+        self.worker = get_ident()
+
+    def run(self, func, *args, timeout=DRIVER_COMMAND_TIMEOUT):
+        # Calls func on the worker thread. Raises SessionError if it does not return within timeout seconds
+        if get_ident() == self.worker:
+            return func(*args)
+        future = self.executor.submit(func, *args)
+        try:
+            return future.result(timeout)
+        except FutureTimeoutError:
+            raise SessionError(f"Browser did not answer within {timeout}s")
+
+    def command(self, driver_command, params=None):
+        return self.run(self.execute, driver_command, params)
+
+    def close(self):
+        # A command that is stuck in the browser keeps the worker until the browser is closed
+        self.executor.shutdown(wait=False)
+
+
+def serialize_browser():
+    # Sends every command of the browser, including those of its elements, through its own DriverThread
+    browser.driver_thread = DriverThread(browser.execute)
+    browser.execute = browser.driver_thread.command
+
+
+def kill_browser_processes():
+    # Kills the driver and, if psutil is installed, the browser processes it started
+    driver_process = getattr(getattr(browser, "service", None), "process", None)
+    if driver_process is None:
+        return
+    try:
+        import psutil
+    except ImportError:
+        psutil = None
+    if psutil is not None:
+        try:
+            processes = psutil.Process(driver_process.pid).children(recursive=True)
+        except psutil.Error:
+            processes = []
+        for process in processes:
+            try:
+                process.kill()
+            except psutil.Error:
+                pass
+    try:
+        driver_process.kill()
+        driver_process.wait(5)
+    except (OSError, subprocess.TimeoutExpired):
+        pass
+
+
+def quit_browser():
+    # Closes the browser and stops its driver thread. A browser that does not close within QUIT_TIMEOUT is killed
+    global browser
+    if browser is None:
+        return
+    driver_thread = getattr(browser, "driver_thread", None)
+    try:
+        if driver_thread is not None:
+            driver_thread.run(browser.quit, timeout=QUIT_TIMEOUT)
+        else:
+            browser.quit()
+    except SessionError:
+        print(f"Browser did not close within {QUIT_TIMEOUT}s, killing it...")
+        kill_browser_processes()
+    except Exception:
+        pass
+    if driver_thread is not None:
+        driver_thread.close()
+    browser = None
+
+
+def launch_browser(chrome_type, driver_path, chrome_options):
+    if chrome_type == "msedge":
+        from msedge.selenium_tools import Edge
+        return Edge(driver_path, options=chrome_options)
+    return webdriver.Chrome(driver_path, options=chrome_options)
+
+
+def load_driver_cache():
+    try:
+        with open(DRIVER_CACHE_FILE) as cache_file:
+            return json.load(cache_file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def get_cached_driver(chrome_type):
+    # Returns the driver path that last worked with this browser, if it still exists
+    driver_path = load_driver_cache().get(chrome_type)
+    if not isinstance(driver_path, str) or not os.path.isfile(driver_path):
+        return None
+    return driver_path
+
+
+def save_cached_driver(chrome_type, driver_path):
+    # Remembers the driver that worked with this browser
+    cache = load_driver_cache()
+    if cache.get(chrome_type) == driver_path:
+        return
+    cache[chrome_type] = driver_path
+    with open(DRIVER_CACHE_FILE, "w") as cache_file:
+        json.dump(cache, cache_file, indent=2)
+
+
+def block_resources():
+    # Uses the DevTools protocol to stop loading fonts and images and to reduce animations
+    try:
+        browser.execute_cdp_cmd('Network.enable', {})
+        browser.execute_cdp_cmd('Network.setBlockedURLs', {'urls': [
+            "*.woff", "*.woff2", "*.ttf", "*.otf", "*.png", "*.jpg", "*.jpeg", "*.gif", "*.svg?*", "*.webp"]})
+        browser.execute_cdp_cmd('Emulation.setEmulatedMedia', {
+            'features': [{'name': 'prefers-reduced-motion', 'value': 'reduce'}]})
+    except (AttributeError, exceptions.WebDriverException):
+        print("Could not block resources in this browser.")
+
+
+def get_process_usage():
+    # Returns the number of processes, resident memory in bytes and CPU seconds of the driver and every
+    # browser process it started, or None if psutil is not installed
+    try:
+        import psutil
+    except ImportError:
+        return None
+    try:
+        driver = psutil.Process(browser.service.process.pid)
+        processes = [driver] + driver.children(recursive=True)
+    except (AttributeError, psutil.Error):
+        return None
+    count, memory, cpu_time = 0, 0, 0
+    for process in processes:
+        try:
+            memory += process.memory_info().rss
+            cpu = process.cpu_times()
+            cpu_time += cpu.user + cpu.system
+            count += 1
+        except psutil.Error:
+            # The process exited since the list was made
+            continue
+    return count, memory, cpu_time
+
+
+def print_resource_usage():
+    # Prints the memory and CPU use of the browser processes, and the JS heap and main thread use of the page
+    global last_resource_usage
+    try:
+        browser.execute_cdp_cmd('Performance.enable', {})
+        result = browser.execute_cdp_cmd('Performance.getMetrics', {})
+    except (AttributeError, exceptions.WebDriverException):
+        return
+    values = {metric['name']: metric['value'] for metric in result['metrics']}
+    now = time.time()
+    busy = values.get('TaskDuration', 0)
+    processes = get_process_usage()
+    cpu_time = processes[2] if processes is not None else None
+
+    usage = ""
+    if processes is not None:
+        usage += f"Browser processes: {processes[1] / 1024 / 1024:.0f} MB in {processes[0]} processes"
+        if last_resource_usage is not None and last_resource_usage[2] is not None:
+            # Processes that exited take their CPU time with them, so the difference can be negative
+            used = max(cpu_time - last_resource_usage[2], 0)
+            usage += f", CPU: {100 * used / max(now - last_resource_usage[0], 1):.1f}% of a core"
+        usage += "\n"
+    usage += f"Page: {values.get('JSHeapUsedSize', 0) / 1024 / 1024:.0f} MB JS heap, " \
+             f"{values.get('Nodes', 0):.0f} DOM nodes"
+    if last_resource_usage is not None:
+        used = max(busy - last_resource_usage[1], 0)
+        usage += f", main thread: {100 * used / max(now - last_resource_usage[0], 1):.1f}% of a core"
+    print(usage)
+    last_resource_usage = (now, busy, cpu_time)
 
 
 def init_browser():
     # Setting up the chosen web browser for automation
-    global browser
+    global browser, last_resource_usage
+
+    # The CPU use of a new browser is counted from its own start
+    last_resource_usage = None
 
     if "chrome_type" in config and config['chrome_type'] == "msedge":
+        from msedge.selenium_tools import EdgeOptions
         chrome_options = EdgeOptions()
         chrome_options.use_chromium = True
     else:
@@ -75,7 +503,7 @@ def init_browser():
     chrome_options.add_argument('--ignore-certificate-errors')
     chrome_options.add_argument('--ignore-ssl-errors')
     chrome_options.add_argument('--use-fake-ui-for-media-stream')
-    chrome_options.add_experimental_option('prefs', {
+    prefs = {
         'credentials_enable_service': False,
         'profile.default_content_setting_values.media_stream_mic': 1,
         'profile.default_content_setting_values.media_stream_camera': 1,
@@ -84,7 +512,18 @@ def init_browser():
         'profile': {
             'password_manager_enabled': False
         }
-    })
+    }
+    low_resource = "low_resource" in config and config['low_resource']
+    if low_resource:
+        # Skip work the bot does not need: images, web fonts and GPU compositing
+        prefs['profile.managed_default_content_settings.images'] = 2
+        chrome_options.add_argument('--blink-settings=imagesEnabled=false')
+        chrome_options.add_argument('--disable-remote-fonts')
+        chrome_options.add_argument('--disable-gpu')
+        chrome_options.add_argument('--disable-extensions')
+        chrome_options.add_argument('--disable-background-networking')
+        print("Enabled low resource mode")
+    chrome_options.add_experimental_option('prefs', prefs)
     chrome_options.add_argument('--no-sandbox')
     chrome_options.add_experimental_option('excludeSwitches', ['enable-automation', 'enable-logging'])
 
@@ -95,40 +534,209 @@ def init_browser():
     if "mute_audio" in config and config['mute_audio']:
         chrome_options.add_argument('--mute-audio')
 
-    if "chrome_type" in config:
-        if config['chrome_type'] == "chromium":
-            browser = webdriver.Chrome(ChromeDriverManager(chrome_type=ChromeType.CHROMIUM).install(),
-                                       options=chrome_options)
-        elif config['chrome_type'] == "msedge":
-            browser = Edge(EdgeChromiumDriverManager().install(), options=chrome_options)
-        else:
-            browser = webdriver.Chrome(ChromeDriverManager().install(), options=chrome_options)
+    # Keep the browser data in its own directory, so several accounts can run side by side
+    if "profile_dir" in config and config['profile_dir'] != "":
+        chrome_options.add_argument(f"--user-data-dir={os.path.abspath(config['profile_dir'])}")
+
+    chrome_type = config['chrome_type'] if "chrome_type" in config else "google-chrome"
+
+    phase_start = time.time()
+    if "driver_path" in config and config['driver_path'] != "":
+        driver_path = config['driver_path']
+        browser = launch_browser(chrome_type, driver_path, chrome_options)
     else:
-        browser = webdriver.Chrome(ChromeDriverManager().install(), options=chrome_options)
+        # Try the driver that worked last time before asking the driver manager
+        driver_path = get_cached_driver(chrome_type)
+        browser = None
+        if driver_path is not None:
+            try:
+                browser = launch_browser(chrome_type, driver_path, chrome_options)
+            except exceptions.WebDriverException:
+                print("Cached driver does not work with the browser, installing a new one...")
+        if browser is None:
+            driver_phase_start = time.time()
+            driver_path = install_driver(chrome_type)
+            print_phase_time("Driver install", driver_phase_start)
+            browser = launch_browser(chrome_type, driver_path, chrome_options)
+        save_cached_driver(chrome_type, driver_path)
+    print_phase_time("Browser launch", phase_start)
+    serialize_browser()
 
     # Resize the window according to config, or a minimum
-    width = 1200
+    width = 1024 if low_resource else 1200
     if "window_width" in config and config['window_width'] > 0:
         width = config['window_width']
-    height = 850
+    height = 700 if low_resource else 850
     if "window_height" in config and config['window_height'] > 0:
         height = config['window_height']
     browser.set_window_size(width, height)
     print("Resized window.")
 
+    if low_resource:
+        block_resources()
+
+    instrument_browser()
+    print_resource_usage()
 
-def wait_until_found(sel, timeout, print_error=True):
-    # Waits for an element to appear on the page, until timeout
+
+def wait_until_found(sel, timeout, print_error=True, name=None):
+    # Waits for an element to appear on the page, until timeout. The wait is recorded in the metrics under
+    # name, or the selector if not given. Selectors that contain a meeting id need a name, so that every
+    # meeting is not recorded as a metric of its own
+    metric_name = f"wait_until_found {name if name is not None else sel}"
+    start = time.time()
     try:
         element_present = EC.visibility_of_element_located((By.CSS_SELECTOR, sel))
         WebDriverWait(browser, timeout).until(element_present)
-        return browser.find_element_by_css_selector(sel)
+        element = browser.find_element_by_css_selector(sel)
+        record_timing(metric_name, time.time() - start)
+        return element
     except exceptions.TimeoutException:
+        record_timing(metric_name, time.time() - start, timed_out=True)
         if print_error:
             print(f"Timeout waiting for element: {sel}")
         return None
 
 
+def log_event(event, **fields):
+    # Appends a meeting event to the event log, used by --simulate to tune the intervals
+    if "event_log" not in config or config['event_log'] == "":
+        return
+    with open(config['event_log'], "a") as event_log:
+        event_log.write(json.dumps({'t': round(time.time(), 1), 'event': event, **fields}) + "\n")
+
+
+def record_timing(name, duration, timed_out=False):
+    # Adds a call to the metrics, and to the metrics file if enabled
+    with metrics_lock:
+        if name not in metrics:
+            metrics[name] = {'count': 0, 'total': 0, 'max': 0, 'timeouts': 0, 'buckets': [0] * len(METRIC_BUCKETS)}
+        metric = metrics[name]
+        metric['count'] += 1
+        metric['total'] += duration
+        metric['max'] = max(metric['max'], duration)
+        if timed_out:
+            metric['timeouts'] += 1
+        for i, bucket in enumerate(METRIC_BUCKETS):
+            if duration <= bucket:
+                metric['buckets'][i] += 1
+
+        if metrics_file is not None:
+            metrics_file.write(json.dumps({'time': round(time.time(), 3), 'name': name,
+                                           'duration': round(duration, 4), 'timed_out': timed_out}) + "\n")
+            metrics_file.flush()
+
+
+def copy_metrics():
+    # Returns a sorted snapshot of the metrics that other threads can read safely
+    with metrics_lock:
+        return sorted((name, {**metric, 'buckets': list(metric['buckets'])}) for name, metric in metrics.items())
+
+
+def timed(name):
+    # Decorator that records the duration of every call to a function
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.time()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record_timing(name, time.time() - start)
+        return wrapper
+    return decorator
+
+
+def instrument_browser():
+    # Records the duration of the browser calls used to inspect the page
+    for method in ("find_element_by_css_selector", "find_elements_by_css_selector",
+                   "find_element_by_xpath", "execute_script"):
+        setattr(browser, method, timed(method)(getattr(browser, method)))
+
+
+def print_timings():
+    # Prints a summary of how long the instrumented calls took
+    current = copy_metrics()
+    if len(current) == 0:
+        return
+    print("\nTimings:")
+    for name, metric in current:
+        timeouts = f", {metric['timeouts']} timeouts" if metric['timeouts'] else ""
+        print(f"\t{name}: {metric['count']}x, avg {metric['total'] / metric['count']:.2f}s, "
+              f"max {metric['max']:.2f}s{timeouts}")
+
+
+def format_metrics():
+    # Returns the metrics in the Prometheus text format
+    current = copy_metrics()
+    lines = ["# TYPE auto_joiner_duration_seconds histogram"]
+    for name, metric in current:
+        label = name.replace("\\", "\\\\").replace('"', '\\"')
+        for bucket, count in zip(METRIC_BUCKETS, metric['buckets']):
+            lines.append(f'auto_joiner_duration_seconds_bucket{{name="{label}",le="{bucket}"}} {count}')
+        lines.append(f'auto_joiner_duration_seconds_bucket{{name="{label}",le="+Inf"}} {metric["count"]}')
+        lines.append(f'auto_joiner_duration_seconds_sum{{name="{label}"}} {metric["total"]}')
+        lines.append(f'auto_joiner_duration_seconds_count{{name="{label}"}} {metric["count"]}')
+
+    lines.append("# TYPE auto_joiner_timeouts_total counter")
+    for name, metric in current:
+        label = name.replace("\\", "\\\\").replace('"', '\\"')
+        lines.append(f'auto_joiner_timeouts_total{{name="{label}"}} {metric["timeouts"]}')
+    return "\n".join(lines) + "\n"
+
+
+def close_metrics():
+    global metrics_file
+    with metrics_lock:
+        if metrics_file is not None:
+            metrics_file.close()
+            metrics_file = None
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = format_metrics().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics():
+    # Opens the metrics file and starts the metrics web server, if enabled in the config
+    global metrics_file
+    if "metrics_file" in config and config['metrics_file'] != "":
+        metrics_file = open(config['metrics_file'], "a")
+    if "metrics_port" in config and config['metrics_port'] > 0:
+        try:
+            server = HTTPServer(("127.0.0.1", config['metrics_port']), MetricsHandler)
+        except OSError as e:
+            # For example when another account already uses the port
+            print(f"Could not serve metrics on port {config['metrics_port']}:", e)
+            return
+        Thread(target=server.serve_forever, daemon=True).start()
+        print(f"Serving metrics on http://127.0.0.1:{config['metrics_port']}/metrics")
+
+
+def wait_for(name, condition, timeout, poll=0.2):
+    # Calls condition until it returns a truthy value or timeout seconds pass, and records the time taken
+    start = time.time()
+    while True:
+        try:
+            result = condition()
+        except exceptions.WebDriverException:
+            result = None
+        if result or time.time() - start >= timeout:
+            break
+        time.sleep(poll)
+    record_timing(name, time.time() - start, timed_out=not result)
+    return result
+
+
 def switch_to_calendar_tab():
     # Clicks the calendar icon on the left of the window
     calendar_button = wait_until_found(
@@ -142,6 +750,13 @@ def switch_to_calendar_tab():
             return False
 
 
+# Text of the calendar view switcher, or null if it is not on the page
+VIEW_SWITCHER_TEXT_SCRIPT = """
+var switcher = document.querySelector(arguments[0]);
+return switcher ? switcher.innerText.trim() : null;
+"""
+
+
 def prepare_calendar_page():
     # Opens and switches the calendar to Day View so meeting search works
     print("Waiting for calendar to load...")
@@ -163,11 +778,10 @@ def prepare_calendar_page():
         # Continually try switching to day view
         success = False
         while not success:
-            view_switcher = wait_until_found(switcher_string, 1)
+            view_switcher = wait_until_found(switcher_string, 3)
             if view_switcher is None:
                 print("Reopening calendar page...")
                 switch_to_calendar_tab()
-                time.sleep(2)
                 continue
             # Open switcher and click Day
             browser.execute_script("arguments[0].click();", view_switcher)
@@ -175,91 +789,602 @@ def prepare_calendar_page():
                 "li[role='presentation'].ms-ContextualMenu-item>button[aria-posinset='1']", 5)
             day_button.click()
             # Check if the change worked
-            view_switcher = wait_until_found(switcher_string, 1)
-            if view_switcher is not None and view_switcher.text == "Day":
-                success = True
-            time.sleep(1)
+            success = wait_for("calendar day view", lambda: browser.execute_script(
+                VIEW_SWITCHER_TEXT_SCRIPT, switcher_string) == "Day", 2)
         print("Switched calendar view mode.")
     except Exception as e:
-        print("\nFailed to load calendar:", e)
-        exit(1)
+        raise SessionError(f"Failed to load calendar: {e}")
+
+
+# Records added and removed calendar cards into a page-side buffer. The observer
+# only watches the card holder, which is attached again by WATCHER_DRAIN_SCRIPT
+WATCHER_SCRIPT = """
+if (window.autoJoinerWatcher !== undefined) {
+    return;
+}
+var watcher = {events: [], holder: null};
+watcher.observer = new MutationObserver(function (mutations) {
+    mutations.forEach(function (mutation) {
+        [mutation.addedNodes, mutation.removedNodes].forEach(function (nodes) {
+            for (var i = 0; i < nodes.length; i++) {
+                if (nodes[i].nodeType === 1 && nodes[i].matches("div[class*='multi-day-renderer__eventCard']") &&
+                        watcher.events.length < 100) {
+                    watcher.events.push("card");
+                }
+            }
+        });
+    });
+});
+window.autoJoinerWatcher = watcher;
+"""
+
+# Returns and clears the buffered card changes together with whether a call is active,
+# or null if the watcher is missing
+WATCHER_DRAIN_SCRIPT = """
+var watcher = window.autoJoinerWatcher;
+if (watcher === undefined) {
+    return null;
+}
+var holder = document.querySelector("div[class*='__cardHolder']");
+if (holder !== watcher.holder) {
+    watcher.observer.disconnect();
+    if (holder !== null) {
+        watcher.observer.observe(holder, {childList: true, subtree: true});
+    }
+    watcher.holder = holder;
+}
+var events = watcher.events;
+watcher.events = [];
+return {cards_changed: events.length > 0, in_call: document.querySelector(".calling-unified-bar") !== null};
+"""
+
+
+def install_watcher():
+    # Injects the MutationObserver, if the page does not already have one
+    try:
+        browser.execute_script(WATCHER_SCRIPT)
+        return True
+    except exceptions.JavascriptException:
+        return False
 
 
-def get_calendar_meetings():
-    global meetings, join_early_offset
+def drain_watcher():
+    # Returns the changes since the last call, injecting the watcher again if the page was reloaded
+    try:
+        changes = browser.execute_script(WATCHER_DRAIN_SCRIPT)
+    except exceptions.JavascriptException:
+        changes = None
+    if changes is None:
+        install_watcher()
+    return changes
+
+
+def wait_for_page_change(timeout, kinds=("card", "call")):
+    # Waits up to timeout seconds for the calendar cards or the call state to change
+    end_time = time.time() + timeout
+
+    # Discard the changes made by the bot itself, like scanning the calendar
+    changes = drain_watcher()
+    in_call = changes['in_call'] if changes is not None else None
+    while True:
+        remaining = end_time - time.time()
+        if remaining <= 0:
+            return False
+        time.sleep(min(1, remaining))
 
+        changes = drain_watcher()
+        if changes is None:
+            continue
+        if "card" in kinds and changes['cards_changed']:
+            return True
+        if "call" in kinds and in_call is not None and changes['in_call'] != in_call:
+            return True
+        in_call = changes['in_call']
+
+
+# Collects the position, title and id of every calendar card in one round-trip
+CALENDAR_CARDS_SCRIPT = """
+return Array.from(document.querySelectorAll("div[class*='multi-day-renderer__eventCard']")).map(function (card) {
+    var inner = card.querySelector("div");
+    return {
+        style: card.getAttribute("style") || "",
+        title: inner ? inner.getAttribute("title") : null,
+        id: inner ? inner.getAttribute("id") : null
+    };
+});
+"""
+
+
+CARD_TOP_RE = re.compile(r"(?:^|;)\s*top:\s*([\d.]+)rem")
+CARD_HEIGHT_RE = re.compile(r"(?:^|;)\s*height:\s*([\d.]+)%")
+
+
+def parse_meeting_card(style_string, midnight):
+    # Use the card's position on page to find the start time. Other properties, like left, may be in the style too
+    top_match = CARD_TOP_RE.search(style_string)
+    height_match = CARD_HEIGHT_RE.search(style_string)
+    if top_match is None or height_match is None:
+        raise ValueError(f"no position in card style: {style_string}")
+    minutes_from_midnight = round(float(top_match.group(1)) / .135)
+    start_time = midnight + minutes_from_midnight * 60
+
+    # Find the meeting duration in seconds using the card height
+    duration = round(float(height_match.group(1)) / 100 * 24 * 60 * 60)
+    end_time = start_time + duration
+
+    return start_time, end_time
+
+
+def get_join_time(m_id, start_time):
+    # Time at which a meeting should be joined, including the random delay if enabled
+    join_time = start_time - join_early_offset
+    if "random_delay" in config and config['random_delay']:
+        if m_id not in join_delays:
+            join_delays[m_id] = random.randrange(10, 31, 1)
+        join_time += join_delays[m_id]
+    return join_time
+
+
+def time_until_next_deadline(max_delay):
+    # Seconds until the next meeting should be joined or left, at most max_delay
+    now = time.time()
+
+    # Deadlines up to the last scan were handled by it. Deadlines that passed since then,
+    # for example while joining or finding meeting links, are due now
+    while join_deadlines and join_deadlines[0][0] <= last_scan_time:
+        heapq.heappop(join_deadlines)
+
+    deadlines = []
+    if join_deadlines and current_meeting is None:
+        deadlines.append(join_deadlines[0][0])
+    if leave_at is not None and leave_at > now:
+        deadlines.append(leave_at)
+
+    delay = max_delay
+    for deadline in deadlines:
+        delay = min(delay, deadline - now)
+    return max(delay, 0)
+
+
+def sleep_until(timestamp):
+    # Sleeps until the given unix time
+    delay = timestamp - time.time()
+    if delay > 0:
+        time.sleep(delay)
+
+
+def read_teams_calendar():
+    # Reads today's meetings from the calendar cards in Teams
+    switch_to_calendar_tab()
     if wait_until_found("div[class*='__cardHolder']", 5) is None:
-        return
+        return None
 
-    meeting_cards = browser.find_elements_by_css_selector("div[class*='multi-day-renderer__eventCard']")
-    if len(meeting_cards) == 0:
-        return
-    
     try:
-        for meeting_card in meeting_cards:
-            # Use the card's position on page to find the start time
-            style_string = meeting_card.get_attribute("style")
-            top_offset = float(style_string[style_string.find("top: ") + 5:style_string.find("rem;")])
-            minutes_from_midnight = int(top_offset / .135)
-            midnight = datetime.now().replace(hour=0, minute=0, second=0)
-            midnight = int(datetime.timestamp(midnight))
-            start_time = midnight + minutes_from_midnight * 60
-
-            # Find the meeting duration in seconds using the card height
-            card_height_percent = style_string[style_string.find("height: ") + 8:-2]
-            duration = round(float(card_height_percent) / 100 * 24 * 60 * 60)
-            end_time = start_time + duration
-
-            sec_meeting_card = meeting_card.find_element_by_css_selector("div")
-            meeting_name = sec_meeting_card.get_attribute("title").replace("\n", " ")
-            meeting_id = sec_meeting_card.get_attribute("id")
-
-            # Check if the current time is within the event card range,
-            # then add the meeting to the list
-            unix_time = datetime.now().timestamp()
-            if unix_time + join_early_offset > start_time and unix_time < end_time:
-                meetings.append(Meeting(meeting_id, start_time, meeting_name))
-        return True
-    except exceptions.StaleElementReferenceException:
+        cards = browser.execute_script(CALENDAR_CARDS_SCRIPT)
+    except exceptions.JavascriptException:
         print("Failed to get meeting times.")
+        return None
+    if not cards:
+        return {}
+
+    midnight = datetime.now().replace(hour=0, minute=0, second=0)
+    midnight = int(datetime.timestamp(midnight))
+
+    entries = {}
+    for card in cards:
+        if card['id'] is None:
+            continue
+        try:
+            start_time, end_time = parse_meeting_card(card['style'], midnight)
+        except ValueError:
+            print(f"Could not read the time of meeting card: {card['style']}")
+            continue
+        meeting_name = card['title'].replace("\n", " ") if card['title'] else card['title']
+        entries[card['id']] = (start_time, end_time, meeting_name, None)
+    return entries
+
+
+def read_calendar_source(source):
+    # Returns the text of a calendar file or URL
+    if source.startswith("http://") or source.startswith("https://"):
+        with urllib.request.urlopen(source, timeout=30) as response:
+            return response.read().decode("utf-8")
+    with open(source, encoding="utf-8") as source_file:
+        return source_file.read()
+
+
+def parse_graph_time(value):
+    # Converts a Microsoft Graph {"dateTime", "timeZone"} to a local datetime. Other time zones than UTC are taken
+    # as local time. Graph uses 7 digits for the fraction of a second, which fromisoformat only reads since Python 3.11
+    local_time = datetime.fromisoformat(value['dateTime'].split(".")[0])
+    if value.get('timeZone', "UTC") == "UTC":
+        local_time = local_time.replace(tzinfo=timezone.utc).astimezone().replace(tzinfo=None)
+    return local_time
+
+
+def read_json_calendar(text, day):
+    # Reads meetings from a JSON list of {"id", "title", "start", "end", "url"} with ISO times,
+    # or from a Microsoft Graph calendarView export: {"value": [{"id", "subject", "start", "end", "onlineMeeting"}]}
+    events = json.loads(text)
+    graph = isinstance(events, dict)
+    if graph:
+        events = events['value']
+
+    entries = {}
+    for event in events:
+        if graph:
+            if event.get('isCancelled') or event.get('isAllDay'):
+                continue
+            start = parse_graph_time(event['start'])
+            end = parse_graph_time(event['end'])
+            title = event.get('subject')
+            url = (event.get('onlineMeeting') or {}).get('joinUrl') or event.get('onlineMeetingUrl')
+        else:
+            start = datetime.fromisoformat(event['start'])
+            end = datetime.fromisoformat(event['end'])
+            title = event.get('title')
+            url = event.get('url')
+        if start.date() != day and end.date() != day:
+            continue
+        entries[str(event['id'])] = (int(start.timestamp()), int(end.timestamp()), title, url)
+    return entries
+
+
+def parse_ics_time(value, params):
+    # Converts an ICS date-time to a local datetime. Times with a TZID are taken as local time.
+    # Returns None for all day dates and values that cannot be read
+    if "VALUE=DATE" in params.split(";"):
+        return None
+    try:
+        if value.endswith("Z"):
+            utc_time = datetime.strptime(value, "%Y%m%dT%H%M%SZ").replace(tzinfo=timezone.utc)
+            return utc_time.astimezone().replace(tzinfo=None)
+        return datetime.strptime(value, "%Y%m%dT%H%M%S")
+    except ValueError:
+        return None
+
+
+def parse_ics_day(value, params):
+    # Converts an ICS date or date-time to a date, or None if it cannot be read
+    if "VALUE=DATE" in params.split(";") or len(value) == 8:
+        try:
+            return datetime.strptime(value, "%Y%m%d").date()
+        except ValueError:
+            return None
+    local_time = parse_ics_time(value, params)
+    return local_time.date() if local_time is not None else None
+
+
+def parse_ics_duration(value):
+    # Converts an ICS duration like PT1H30M to a timedelta, or None if it cannot be read
+    match = re.fullmatch(r"\+?P(?:(\d+)W)?(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?)?", value)
+    if match is None or value.endswith(("P", "T")):
+        return None
+    weeks, days, hours, minutes, seconds = (int(x) if x else 0 for x in match.groups())
+    return timedelta(weeks=weeks, days=days, hours=hours, minutes=minutes, seconds=seconds)
+
+
+def ics_occurs_on(event, day):
+    # Checks if an event, or one of its repetitions, takes place on the given day
+    start_day = event['start'].date()
+    if day in event['exdates']:
+        return False
+    if 'rrule' not in event:
+        return day == start_day
+    if day < start_day:
         return False
 
-def decide_meeting():
-    global meetings
+    rule = dict(part.split("=", 1) for part in event['rrule'].split(";") if "=" in part)
+    interval = int(rule.get('INTERVAL', 1))
+    if 'UNTIL' in rule and day > datetime.strptime(rule['UNTIL'][:8], "%Y%m%d").date():
+        return False
+
+    weekdays = ["MO", "TU", "WE", "TH", "FR", "SA", "SU"]
+    if rule.get('FREQ') == "DAILY":
+        matches = lambda d: (d - start_day).days % interval == 0
+    elif rule.get('FREQ') == "WEEKLY":
+        by_day = [weekdays.index(x[-2:]) for x in rule.get('BYDAY', weekdays[start_day.weekday()]).split(",")]
+        first_monday = start_day - timedelta(days=start_day.weekday())
+        matches = lambda d: d.weekday() in by_day and (d - first_monday).days // 7 % interval == 0
+    else:
+        print(f"Unsupported repeat rule for {event.get('title')}: {event['rrule']}")
+        return False
+
+    if not matches(day):
+        return False
+    if 'COUNT' in rule:
+        occurrences = sum(1 for n in range((day - start_day).days + 1)
+                          if matches(start_day + timedelta(days=n)))
+        return occurrences <= int(rule['COUNT'])
+    return True
+
+
+def read_ics_calendar(text, day):
+    # Reads the meetings on the given day from an iCalendar file
+    # Long lines are folded onto continuation lines starting with whitespace
+    lines = re.sub(r"\r?\n[ \t]", "", text).splitlines()
+
+    events = []
+    event = None
+    for line in lines:
+        if line == "BEGIN:VEVENT":
+            event = {'exdates': set()}
+        elif line == "END:VEVENT":
+            if event is not None and event.get('start') is not None and 'uid' in event and 'invalid' not in event:
+                events.append(event)
+            event = None
+        elif event is not None and ":" in line:
+            name_params, value = line.split(":", 1)
+            name, _, params = name_params.partition(";")
+            value = value.replace("\\n", " ").replace("\\,", ",").replace("\\;", ";").replace("\\\\", "\\")
+            if name == "UID":
+                event['uid'] = value
+            elif name == "SUMMARY":
+                event['title'] = value
+            elif name == "DTSTART":
+                event['start'] = parse_ics_time(value, params)
+            elif name == "DTEND":
+                event['end'] = parse_ics_time(value, params)
+            elif name == "DURATION":
+                event['duration'] = parse_ics_duration(value)
+            elif name == "RRULE":
+                event['rrule'] = value
+            elif name == "EXDATE":
+                event['exdates'].update(parse_ics_day(x, params) for x in value.split(","))
+                event['exdates'].discard(None)
+            elif name == "RECURRENCE-ID":
+                event['recurrence_id'] = parse_ics_day(value, params)
+                if event['recurrence_id'] is None:
+                    event['invalid'] = True
+            elif name == "X-MICROSOFT-SKYPETEAMSMEETINGURL":
+                event['url'] = value
+            elif name == "DESCRIPTION" and 'url' not in event:
+                link = re.search(r"https://teams\.microsoft\.com/l/meetup-join/[^\s>\"]+", value)
+                if link:
+                    event['url'] = link.group(0)
+
+    # Changed repetitions of a series replace the original repetition on that day
+    moved = {(x['uid'], x['recurrence_id']) for x in events if x.get('recurrence_id')}
+    series = {x['uid']: x for x in events if x.get('recurrence_id') is None}
+
+    entries = {}
+    for event in events:
+        m_id = event['uid']
+        if event.get('recurrence_id') is None:
+            if (event['uid'], day) in moved or not ics_occurs_on(event, day):
+                continue
+        elif event['start'].date() != day:
+            continue
+        elif event['recurrence_id'] != day:
+            # Moved here from another day, the series can also take place on this day
+            m_id = f"{event['uid']}/{event['recurrence_id'].isoformat()}"
+        if event.get('end'):
+            duration = event['end'] - event['start']
+        else:
+            duration = event.get('duration') or timedelta(hours=1)
+        start = datetime.combine(day, event['start'].time())
+        url = event.get('url', series.get(event['uid'], {}).get('url'))
+        entries[m_id] = (int(start.timestamp()), int((start + duration).timestamp()), event.get('title'), url)
+    return entries
+
+
+def get_calendar_days():
+    # Number of days, starting today, to keep in the calendar index
+    if "calendar_days" in config and config['calendar_days'] > 1:
+        return config['calendar_days']
+    return 1
+
+
+def uses_calendar_source():
+    # True if the meetings are read from a calendar_source instead of the Teams calendar page
+    return "calendar_source" in config and config['calendar_source'] != ""
+
+
+def read_meetings():
+    # Returns the meetings as {id: (start, end, title, url)}, from Teams or the configured calendar_source.
+    # Returns None if the calendar could not be read
+    if not uses_calendar_source():
+        return read_teams_calendar()
+
+    source = config['calendar_source']
+    try:
+        text = read_calendar_source(source)
+        read_calendar = read_json_calendar if source.lower().endswith(".json") else read_ics_calendar
+        entries = {}
+        for offset in range(get_calendar_days()):
+            # Repeating events share their id, so every day gets its own id
+            day = date.today() + timedelta(days=offset)
+            for m_id, entry in read_calendar(text, day).items():
+                entries[f"{m_id}@{day.isoformat()}"] = entry
+        return entries
+    except (OSError, ValueError, KeyError, AttributeError, TypeError) as e:
+        print(f"Failed to read calendar source {source}:", e)
+        return None
+
 
+@timed("get_calendar_meetings")
+def get_calendar_meetings():
+    global meetings, join_deadlines, last_scan_time
+
+    entries = read_meetings()
+    last_scan_time = time.time()
+    if entries is None:
+        return False
+    update_calendar_index(entries)
+
+    join_deadlines = []
+    unix_time = last_scan_time
+    for meeting in calendar_index.values():
+        # Check if the current time is within the event card range,
+        # then add the meeting to the list. Otherwise remember when to join it
+        join_time = get_join_time(meeting.m_id, meeting.time_started)
+        if join_time <= unix_time < meeting.time_ended:
+            meetings.append(meeting)
+        elif join_time > unix_time:
+            join_deadlines.append((join_time, meeting.m_id))
+
+    heapq.heapify(join_deadlines)
+    return True
+
+
+def update_calendar_index(entries):
+    # Applies the (start, end, title, url) of every meeting by id to the calendar index, printing what changed
+    global calendar_day
+    first_scan = calendar_day != date.today()
+    if first_scan:
+        # Forget the meetings of previous days without reporting them as removed
+        midnight = datetime.combine(date.today(), datetime.min.time()).timestamp()
+        for m_id in [x.m_id for x in calendar_index.values() if x.time_ended <= midnight]:
+            del calendar_index[m_id]
+            join_urls.pop(m_id, None)
+        calendar_day = date.today()
+
+    for m_id in list(calendar_index):
+        if m_id not in entries:
+            print(f"Meeting removed from calendar: {calendar_index[m_id].title}")
+            del calendar_index[m_id]
+            join_urls.pop(m_id, None)
+
+    for m_id, (start_time, end_time, title, url) in entries.items():
+        meeting = calendar_index.get(m_id)
+        if meeting is not None and (meeting.time_started, meeting.time_ended, meeting.title, meeting.url) == (
+                start_time, end_time, title, url):
+            continue
+        if meeting is not None:
+            print(f"Meeting changed in calendar: {title}")
+        elif not first_scan:
+            print(f"Meeting added to calendar: {title}")
+        calendar_index[m_id] = Meeting(m_id, start_time, title, end_time, url)
+        if url is None and uses_calendar_source():
+            # There is no calendar card to find the link in, so the meeting cannot be joined
+            print(f"Meeting has no join link and will not be joined: {title}")
+            calendar_index[m_id].blacklisted = True
+        log_event("card", id=m_id, title=title, start=start_time, end=end_time)
+
+    if first_scan and len(calendar_index) > 0:
+        print("Upcoming meetings: ", *get_upcoming_meetings(), sep='\n')
+
+
+def get_upcoming_meetings(days=None):
+    # Meetings in the next days (default calendar_days) that have not ended yet, sorted by start time
+    if days is None:
+        days = get_calendar_days()
+    unix_time = time.time()
+    until = datetime.combine(date.today() + timedelta(days=days), datetime.min.time()).timestamp()
+    upcoming = [x for x in calendar_index.values() if x.time_ended > unix_time and x.time_started < until]
+    upcoming.sort(key=lambda x: x.time_started)
+    return upcoming
+
+
+def choose_meeting(candidates, joined_ids):
     # Ignore blacklisted and already joined meetings
-    meetings = [x for x in meetings if not x.blacklisted]
-    meetings = [x for x in meetings if x.m_id not in already_joined_ids]
-    if len(meetings) == 0:
+    candidates = [x for x in candidates if not x.blacklisted]
+    candidates = [x for x in candidates if x.m_id not in joined_ids]
+    if len(candidates) == 0:
         return
 
-    # Sort meetings by closest to current time
-    meetings.sort(key=lambda x: x.time_started, reverse=True)
-    newest_meeting = meetings[0]
+    # Pick the meeting closest to current time
+    return max(candidates, key=lambda x: x.time_started)
 
-    return newest_meeting
 
+def decide_meeting():
+    return choose_meeting(meetings, already_joined_ids)
 
-def join_meeting(meeting):
-    global hangup_thread, current_meeting, already_joined_ids
 
-    switch_to_calendar_tab()
+# Returns the aria-pressed state of the video and mute toggles
+TOGGLE_STATE_SCRIPT = """
+return ["toggle-video", "toggle-mute"].map(function (tid) {
+    var button = document.querySelector("toggle-button[data-tid='" + tid + "']>div>button");
+    return button ? button.getAttribute("aria-pressed") : null;
+});
+"""
 
-    # Find the meeting link in the event card edit page
-    event_card = wait_until_found(f"div[id='{meeting.m_id}']", 5)
+
+def wait_for_toggles_to_settle(settle_time=1, timeout=3):
+    # Waits until Teams stops changing the camera and mic toggles by itself
+    state = {'last': None, 'since': time.time()}
+
+    def toggles_settled():
+        toggles = browser.execute_script(TOGGLE_STATE_SCRIPT)
+        if toggles != state['last']:
+            state['last'] = toggles
+            state['since'] = time.time()
+            return False
+        return None not in toggles and time.time() - state['since'] >= settle_time
+
+    wait_for("prejoin toggles", toggles_settled, timeout)
+
+
+def play_sound(sound_file):
+    # Runs in its own thread so the main loop keeps going while the sound plays
+    import playsound
+    try:
+        playsound.playsound(sound_file)
+        print("Played join sound")
+    except playsound.PlaysoundException:
+        print("Could not play the specified sound file.")
+
+
+def get_join_url(url):
+    # Add /_#/ to the URL to go to the Join Call page. Other links, like teams.live.com, are opened as they are
+    if "/_#/l/" in url or "/l/" not in url:
+        return url
+    split_index = url.index('/l/')
+    return url[0:split_index] + "/_#/l/" + url[split_index + 3:]
+
+
+def resolve_join_url(meeting):
+    # Finds the meeting link in the event card edit page, and caches it.
+    # Meetings from a calendar_source have no card, so only the link they were read with is used
+    if meeting.url is not None:
+        return get_join_url(meeting.url)
+    if meeting.m_id in join_urls:
+        return join_urls[meeting.m_id]
+    if uses_calendar_source():
+        return None
+
+    switch_to_calendar_tab()
+    event_card = wait_until_found(f"div[id='{meeting.m_id}']", 5, name="event card")
+    if event_card is None:
+        return None
     event_card.click()
 
     edit_button = wait_until_found('button[class*="meeting-header__button', 1)
     browser.execute_script("arguments[0].click();", edit_button)
 
     meeting_link = wait_until_found('.me-email-headline', 5)
-    if meeting_link:
-        url = meeting_link.get_attribute('href')
-        # Add /_#/ to the URL to go to the Join Call page
-        split_index = url.index('/l/')
-        url = url[0:split_index] + "/_#/l/" + url[split_index + 3:]
-    else:
+    if meeting_link is None:
         print("\nCould not find meeting link.")
+        return None
+    join_urls[meeting.m_id] = get_join_url(meeting_link.get_attribute('href'))
+    return join_urls[meeting.m_id]
+
+
+def prefetch_join_urls(lookahead):
+    # Resolves the link of the next meeting that will be joined within lookahead seconds. Only one link
+    # is looked up per call, so the main loop gets back to its deadlines and the page watcher quickly
+    resolved = False
+    for join_time, m_id in sorted(join_deadlines):
+        meeting = calendar_index.get(m_id)
+        if (join_time > time.time() + lookahead or meeting is None or meeting.blacklisted or
+                meeting.url is not None or m_id in join_urls or m_id in already_joined_ids):
+            continue
+        if resolve_join_url(meeting) is not None:
+            print(f"Found meeting link for: {meeting.title}")
+            resolved = True
+        break
+    # Go back to the calendar, which was left to find the links
+    if resolved:
+        switch_to_calendar_tab()
+
+
+@timed("join_meeting")
+def join_meeting(meeting):
+    global current_meeting, leave_at, member_history
+
+    join_start = time.time()
+    url = resolve_join_url(meeting)
+    if url is None:
         return
 
     # Open the meeting link
@@ -270,7 +1395,7 @@ def join_meeting(meeting):
         return
 
     # Wait for auto disable by teams
-    time.sleep(3)
+    wait_for_toggles_to_settle()
 
     # Attempt to turn camera off
     video_btn = browser.find_element_by_css_selector("toggle-button[data-tid='toggle-video']>div>button")
@@ -286,41 +1411,95 @@ def join_meeting(meeting):
         audio_btn.click()
         print("Audio off")
 
-    # Wait for a random delay if enabled
-    if "random_delay" in config and config['random_delay']:
-        delay = random.randrange(10, 31, 1)
-        print(f"Waiting for {delay}s")
-        time.sleep(delay)
-
     # Join the meeting. Need to find again to avoid stale element exception
     join_now_btn = wait_until_found("button[data-tid='prejoin-join-button']", 5)
     if join_now_btn is None:
         return
     join_now_btn.click()
+    record_timing("join", time.time() - join_start)
+    log_event("join", id=meeting.m_id, latency=round(time.time() - join_start, 2))
+    print(f"Joining took {time.time() - join_start:.1f}s")
 
     # Play a sound to indicate that the bot has joined a meeting
     if "join_sound" in config and not config["join_sound"] == "":
-        try:
-            playsound.playsound(config["join_sound"])
-            print("Played join sound")
-        except playsound.PlaysoundException:
-            print("Could not play the specified sound file.")
+        Thread(target=play_sound, args=(config["join_sound"],), daemon=True).start()
 
     current_meeting = meeting
-    already_joined_ids.append(meeting.m_id)
+    member_history = new_member_history()
+    mark_joined(meeting.m_id)
 
     print(f"Joined meeting: {meeting.title}")
 
+    if "low_resource" in config and config['low_resource']:
+        turn_off_incoming_video()
+
     if meeting.auto_leave_blacklisted:
         print("\nMeeting is auto leave blacklisted, will not check member count.\n")
 
-    # Start a thread to hangup the call after delay
+    # Remember when to hangup the call
     if "auto_leave_after_min" in config and config['auto_leave_after_min'] > 0:
-        hangup_thread = Timer(config['auto_leave_after_min'] * 60, hangup)
-        hangup_thread.start()
+        leave_at = time.time() + config['auto_leave_after_min'] * 60
+
+
+# Hides the video elements of the call, so the browser does not draw them
+HIDE_VIDEO_SCRIPT = """
+if (document.getElementById("auto-joiner-hide-video") === null) {
+    var style = document.createElement("style");
+    style.id = "auto-joiner-hide-video";
+    style.textContent = "video { display: none !important; }";
+    document.head.appendChild(style);
+}
+"""
+
+
+def turn_off_incoming_video():
+    # Uses the "Turn off incoming video" item of the call's More actions menu, so Teams stops
+    # sending the other participants' video. The videos that still arrive are not drawn
+    browser.execute_script(HIDE_VIDEO_SCRIPT)
+    more_button = wait_until_found("button[id='callingButtons-showMoreBtn']", 10)
+    if more_button is None:
+        return False
+    browser.execute_script("arguments[0].click();", more_button)
+    video_item = wait_until_found("button[id='incoming-video-button']", 2)
+    if video_item is None:
+        # Close the menu again
+        browser.execute_script("arguments[0].click();", more_button)
+        return False
+    if "Turn off" not in (video_item.get_attribute("aria-label") or ""):
+        # Incoming video is already off
+        browser.execute_script("arguments[0].click();", more_button)
+        return True
+    browser.execute_script("arguments[0].click();", video_item)
+    print("Incoming video off")
+    return True
+
+
+# Sums the numbers in the visible Participants and Attendees roster titles,
+# or returns null if the roster is not open
+MEMBER_COUNT_SCRIPT = """
+var total = null;
+["participantsInCall", "attendeesInMeeting"].forEach(function (key) {
+    var title = document.querySelector("calling-roster-section[section-key='" + key + "'] .roster-list-title");
+    if (title === null || title.offsetParent === null) {
+        return;
+    }
+    (title.getAttribute("aria-label") || "").split(/\\s+/).forEach(function (word) {
+        if (/^\\d+$/.test(word)) {
+            total = (total || 0) + parseInt(word, 10);
+        }
+    });
+});
+return total;
+"""
 
 
+@timed("get_meeting_members")
 def get_meeting_members():
+    # Read the member count from the roster if it is still open from the last check
+    total_participants = browser.execute_script(MEMBER_COUNT_SCRIPT)
+    if total_participants is not None:
+        return total_participants
+
     # Open the meeting into fullscreen, if it is not already
     meeting_elems = browser.find_elements_by_css_selector('.one-call')
     for meeting_elem in meeting_elems:
@@ -330,49 +1509,20 @@ def get_meeting_members():
         except:
             continue
 
-    # Check if the People list is already open. If not, open it
+    print("Participants list is closed, trying to open it...")
     try:
-        list_closed = False
-        ppl_elem = wait_until_found('.people-picker-container', 2)
-        ppl_elem = ppl_elem.find_element_by_xpath('../..')
-        if "ng-hide" in ppl_elem.get_attribute('class'):
-            list_closed = True
+        browser.find_element_by_css_selector("button[id='roster-button']")
+        browser.execute_script("document.getElementById('roster-button').click()")
     except:
-        list_closed = True
-
-    if list_closed:
-        print("Participants list is closed, trying to open it...")
-        try:
-            browser.find_element_by_css_selector("button[id='roster-button']")
-            browser.execute_script("document.getElementById('roster-button').click()")
-        except:
-            return None
+        return None
 
     # Use people list to get the number of meeting members
-    total_participants = 0
-
-    participants_elem = wait_until_found(
-        "calling-roster-section[section-key='participantsInCall'] .roster-list-title", 2)
-    attendees_elem = wait_until_found(
-        "calling-roster-section[section-key='attendeesInMeeting'] .roster-list-title", 2)
-
-    # Sum the number of users in Participants and Attendees
-    try:
-        if participants_elem is not None:
-            total_participants += sum(
-                [int(s) for s in participants_elem.get_attribute("aria-label").split() if s.isdigit()])
-
-        if attendees_elem is not None:
-            total_participants += sum(
-                [int(s) for s in attendees_elem.get_attribute("aria-label").split() if s.isdigit()])
-    except exceptions.StaleElementReferenceException:
-        pass
-
-    return total_participants
+    return wait_for("roster open", lambda: browser.execute_script(MEMBER_COUNT_SCRIPT), 2)
 
 
+@timed("hangup")
 def hangup():
-    global current_meeting
+    global current_meeting, leave_at
     if current_meeting is None:
         return
 
@@ -385,57 +1535,145 @@ def hangup():
         hangup_btn.click()
         print(f"Left Meeting: {current_meeting.title}")
         current_meeting = None
-        if hangup_thread:
-            hangup_thread.cancel()
+        leave_at = None
         return True
     except:
         return False
 
 
-def main():
-    global config, meetings, current_meeting, join_early_offset
-
-    init_browser()
+def is_logged_in():
+    # Waits for either the Teams app or the login page. True if a saved session was used
+    page_elem = wait_until_found("#teams-app-bar, input[type='email']", 30)
+    return page_elem is not None and page_elem.get_attribute("id") == "teams-app-bar"
 
-    browser.get("https://teams.microsoft.com")
 
+def login():
     # Login to account using email and password
-    if config['email'] != "" and config['password'] != "":
-        login_email = wait_until_found("input[type='email']", 30)
-        if login_email is not None:
-            login_email.send_keys(config['email'])
-
-        # find the element again to avoid StaleElementReferenceException
-        login_email = wait_until_found("input[type='email']", 5)
-        if login_email is not None:
-            login_email.send_keys(Keys.ENTER)
-
-        login_pwd = wait_until_found("input[type='password']", 10)
-        if login_pwd is not None:
-            login_pwd.send_keys(config['password'])
-
-        # find the element again to avoid StaleElementReferenceException
-        login_pwd = wait_until_found("input[type='password']", 5)
-        if login_pwd is not None:
-            login_pwd.send_keys(Keys.ENTER)
-
-        keep_logged_in = wait_until_found("input[id='idBtn_Back']", 5)
-        if keep_logged_in is not None:
-            keep_logged_in.click()
-        else:
-            print("Login Unsuccessful, recheck entries in config.json")
+    login_email = wait_until_found("input[type='email']", 30)
+    if login_email is not None:
+        login_email.send_keys(config['email'])
+
+    # find the element again to avoid StaleElementReferenceException
+    login_email = wait_until_found("input[type='email']", 5)
+    if login_email is not None:
+        login_email.send_keys(Keys.ENTER)
+
+    login_pwd = wait_until_found("input[type='password']", 10)
+    if login_pwd is not None:
+        login_pwd.send_keys(config['password'])
+
+    # find the element again to avoid StaleElementReferenceException
+    login_pwd = wait_until_found("input[type='password']", 5)
+    if login_pwd is not None:
+        login_pwd.send_keys(Keys.ENTER)
+
+    # Wait for the "Stay signed in?" page by its No button. Its Yes button has the same id as the Next and
+    # Sign in buttons of the pages before it, so it can only be looked for once this page is shown
+    keep_logged_in = wait_until_found("input[id='idBtn_Back']", 5)
+    # Stay signed in only if the session is kept in a browser profile
+    if keep_logged_in is not None and "profile_dir" in config and config['profile_dir'] != "":
+        keep_logged_in = wait_until_found("input[id='idSIButton9']", 1)
+    if keep_logged_in is not None:
+        keep_logged_in.click()
+    else:
+        print("Login Unsuccessful, recheck entries in config.json")
+
+    use_web_instead = wait_until_found(".use-app-lnk", 5, print_error=False)
+    if use_web_instead is not None:
+        use_web_instead.click()
+
+
+def start_session():
+    # Starts the browser, logs in and opens the calendar
+    init_browser()
+
+    teams_url = "https://teams.microsoft.com"
+    if "teams_url" in config and config['teams_url'] != "":
+        teams_url = config['teams_url']
+    browser.get(teams_url)
 
-        use_web_instead = wait_until_found(".use-app-lnk", 5, print_error=False)
-        if use_web_instead is not None:
-            use_web_instead.click()
+    phase_start = time.time()
+    if is_logged_in():
+        print("Already logged in, skipping login.")
+    elif config['email'] != "" and config['password'] != "":
+        login()
+    print_phase_time("Login", phase_start)
 
+    phase_start = time.time()
     print("Waiting for correct page...")
     if wait_until_found("#teams-app-bar", 60 * 5) is None:
-        exit(1)
+        raise SessionError("Teams did not load")
 
     print("Found page.")
+    print_phase_time("Loading Teams", phase_start)
+
+    # The Teams calendar is only needed when meetings are not read from a calendar_source
+    if not uses_calendar_source():
+        phase_start = time.time()
+        prepare_calendar_page()
+        print_phase_time("Loading calendar", phase_start)
+
+
+def check_browser(timeout=30):
+    # Raises SessionError if the browser does not answer a simple script within timeout seconds
+    try:
+        # Use the driver's own method, so pings are not counted in the execute_script metrics.
+        # The ping waits for the browser's other commands, which all run on its driver thread
+        answer = browser.driver_thread.run(type(browser).execute_script, browser, "return 1", timeout=timeout)
+    except Exception:
+        answer = None
+    if answer != 1:
+        raise SessionError("Browser is not responding")
+
+
+def recover_session(error, attempts=3):
+    # Restarts the browser and rejoins the meeting the bot was in
+    global current_meeting, leave_at
+    print(f"\nLost the browser session ({error}), restarting the browser...")
+    recovery_start = time.time()
+    rejoin = current_meeting if current_meeting is not None and current_meeting.m_id is not None else None
+    rejoin_leave_at = leave_at
+    current_meeting = None
+    leave_at = None
+
+    for attempt in range(1, attempts + 1):
+        quit_browser()
+        try:
+            start_session()
+            break
+        except (exceptions.WebDriverException, DriverConnectionError, SessionError) as e:
+            print(f"Restarting the browser failed (attempt {attempt}/{attempts}):", e)
+            if attempt == attempts:
+                raise
+
+    # Rejoin the meeting, unless it was over anyway
+    if rejoin is not None and (rejoin_leave_at is None or time.time() < rejoin_leave_at):
+        print(f"Rejoining meeting: {rejoin.title}")
+        try:
+            join_meeting(rejoin)
+        except (exceptions.WebDriverException, DriverConnectionError) as e:
+            print("Could not rejoin the meeting:", e)
+        if current_meeting is not None:
+            leave_at = rejoin_leave_at
+
+    record_timing("recovery", time.time() - recovery_start)
+    print_phase_time("Recovering the browser session", recovery_start)
+
+
+def main():
+    global config, meetings, current_meeting, join_early_offset, leave_at
+
+    start_metrics()
+    load_joined_ids()
+    if len(already_joined_ids) > 0:
+        print(f"Skipping {len(already_joined_ids)} meeting(s) already joined today")
+
+    start_session()
 
-    prepare_calendar_page()
+    # Delay in seconds between reports of the browser's memory and CPU use
+    resource_interval = 600
+    if "resource_report_interval" in config and config['resource_report_interval'] >= 0:
+        resource_interval = config['resource_report_interval']
 
     # Delay in seconds between checks for new meetings
     check_interval = 20
@@ -452,93 +1690,502 @@ def main():
     if "auto_leave" in config and config['auto_leave']:
         auto_leave = True
 
-    # Maximum number of people in meeting to automatically leave
-    auto_leave_count = 7
-    if "auto_leave_count" in config and config['auto_leave_count'] > 1:
-        auto_leave_count = config['auto_leave_count']
-
     # Get the offset in seconds to join the meeting early
     join_early_offset = 60
     if "join_early_offset" in config and config['join_early_offset'] > 0:
         join_early_offset = config['join_early_offset']
 
-    while 1:
-        timestamp = datetime.now()
-        # Check for new meetings if we are not currently in one
-        if current_meeting is None:
-            # Check if user has manually joined a meeting
-            meeting_buttons = wait_until_found('.calling-unified-bar', 0, False)
-            if meeting_buttons is not None:
-                print("\nActive meeting detected, user has manually joined.")
-                current_meeting = Meeting(None, None, None)
-                continue
-
-            print(f"\n[{timestamp:%H:%M:%S}] Looking for new meetings")
-
-            # Look for meetings, then join one
-            meetings = []
-            switch_to_calendar_tab()
-            get_calendar_meetings()
-            if len(meetings) > 0:
-                print("Found meetings: ", *meetings, sep='\n')
-                meeting_to_join = decide_meeting()
-                if meeting_to_join is not None:
-                    join_meeting(meeting_to_join)
-            # Check for new meetings after delay
-            time.sleep(check_interval)
-
-        elif current_meeting is not None:
-            # Check if the user has manually left the meeting
-            meeting_buttons = wait_until_found('.calling-unified-bar', 10)
-            if meeting_buttons is None:
-                print("\nNo active meeting detected, searching for new meeting.")
-                current_meeting = None
-                if hangup_thread:
-                    hangup_thread.cancel()
-                continue
-
-            if (current_meeting is not None and auto_leave and
-                    not current_meeting.auto_leave_blacklisted):
+    # React to calendar and call changes instead of only polling on an interval
+    watch_page = False
+    if "watch_page" in config and config['watch_page']:
+        watch_page = install_watcher()
+        if not watch_page:
+            print("Could not start the page watcher, falling back to polling.")
 
-                # Check meeting member count to see if we need to leave
-                members = get_meeting_members()
-                print(f"\n[{timestamp:%H:%M:%S}]", "Current members:", members)
-                if members and 0 < members <= auto_leave_count:
-                    print("Last attendee in meeting")
+    while 1:
+        try:
+            check_browser()
+            timestamp = datetime.now()
+            expire_joined_ids()
+            if (resource_interval > 0 and last_resource_usage is not None and
+                    time.time() - last_resource_usage[0] >= resource_interval):
+                print_resource_usage()
+            # Check for new meetings if we are not currently in one
+            if current_meeting is None:
+                # Check if user has manually joined a meeting
+                meeting_buttons = wait_until_found('.calling-unified-bar', 0, False)
+                if meeting_buttons is not None:
+                    print("\nActive meeting detected, user has manually joined.")
+                    current_meeting = Meeting(None, None, None)
+                    continue
+
+                print(f"\n[{timestamp:%H:%M:%S}] Looking for new meetings")
+
+                # Look for meetings, then join one
+                meetings = []
+                get_calendar_meetings()
+                if len(meetings) > 0:
+                    print("Found meetings: ", *meetings, sep='\n')
+                    meeting_to_join = decide_meeting()
+                    if meeting_to_join is not None:
+                        join_meeting(meeting_to_join)
+                if current_meeting is None:
+                    prefetch_join_urls(5 * 60)
+                # Check for new meetings after delay, when the next one starts,
+                # or as soon as the page changes
+                delay = time_until_next_deadline(check_interval)
+                if watch_page:
+                    wait_for_page_change(delay)
+                else:
+                    time.sleep(delay)
+
+            elif current_meeting is not None:
+                # Check if the user has manually left the meeting
+                meeting_buttons = wait_until_found('.calling-unified-bar', 10)
+                if meeting_buttons is None:
+                    print("\nNo active meeting detected, searching for new meeting.")
+                    log_event("leave", id=current_meeting.m_id, reason="ended")
+                    current_meeting = None
+                    leave_at = None
+                    continue
+
+                # Leave the meeting once auto_leave_after_min has passed
+                if leave_at is not None and time.time() >= leave_at:
+                    print("\nMeeting time is over")
+                    log_event("leave", id=current_meeting.m_id, reason="time")
                     hangup()
-                    time.sleep(check_interval)
-            else:
-                print(f"\n[{timestamp:%H:%M:%S}] Monitoring meeting status...")
-
-            # Check for members after delay
-            time.sleep(member_interval)
+                    continue
+
+                if (current_meeting is not None and auto_leave and
+                        not current_meeting.auto_leave_blacklisted):
+
+                    # Check meeting member count to see if we need to leave
+                    members = get_meeting_members()
+                    print(f"\n[{timestamp:%H:%M:%S}]", "Current members:", members)
+                    log_event("members", id=current_meeting.m_id, count=members)
+                    if member_history.add(members):
+                        print("Last attendee in meeting")
+                        log_event("leave", id=current_meeting.m_id, reason="members")
+                        hangup()
+                        wait_for("call end", lambda: len(
+                            browser.find_elements_by_css_selector('.calling-unified-bar')) == 0, check_interval)
+                else:
+                    print(f"\n[{timestamp:%H:%M:%S}] Monitoring meeting status...")
+
+                # Check for members after delay, when the meeting should be left,
+                # or as soon as the call ends
+                delay = time_until_next_deadline(member_interval)
+                if watch_page:
+                    wait_for_page_change(delay, kinds=("call",))
+                else:
+                    time.sleep(delay)
+        except SessionError as e:
+            recover_session(e)
+        except (exceptions.WebDriverException, DriverConnectionError) as e:
+            # Only restart the browser if it stopped responding, not for errors on the page
+            try:
+                check_browser()
+            except SessionError:
+                recover_session(e)
+                continue
+            print("\nBrowser error, trying again:", e)
+            time.sleep(1)
 
 
-if __name__ == "__main__":
-    # Prevent computer from sleeping while script is running
-    ctypes.windll.kernel32.SetThreadExecutionState(0x80000001)
+def run(config_path='config.json', account=None, wait_for_start=True):
+    # Runs the joiner for one config file. Returns False if the browser could not be reached
+    load_config(config_path)
+    if account is not None:
+        # Give every account its own browser profile and joined meetings file
+        if "profile_dir" not in config or config['profile_dir'] == "":
+            config['profile_dir'] = os.path.join("profiles", account)
+        if "joined_file" not in config or config['joined_file'] == "":
+            config['joined_file'] = f"joined_meetings_{account}.txt"
 
     # Calculate startup delay in seconds based on config
-    load_config()
-    if "run_at_time" in config and config['run_at_time'] != "":
+    if wait_for_start and "run_at_time" in config and config['run_at_time'] != "":
         now = datetime.now()
         run_at = datetime.strptime(config['run_at_time'], "%H:%M").replace(
             year=now.year, month=now.month, day=now.day)
 
         if run_at.time() < now.time():
-            run_at = datetime.strptime(config['run_at_time'], "%H:%M").replace(
-                year=now.year, month=now.month, day=now.day + 1)
+            run_at += timedelta(days=1)
 
         start_delay = (run_at - now).total_seconds()
-        time.sleep(start_delay)
         print(f"Waiting until {run_at} ({int(start_delay)}s)")
+        sleep_until(run_at.timestamp())
     try:
         main()
-    except exceptions.WebDriverException:
+        return True
+    except (exceptions.WebDriverException, DriverConnectionError):
         print("Selenium client unreachable, exiting...")
+        return False
+    except SessionError as e:
+        print(f"{e}, exiting...")
+        return False
     finally:
-        if browser is not None:
-            browser.quit()
-        if hangup_thread is not None:
-            hangup_thread.cancel()
-        input("Push enter to exit.")
+        quit_browser()
+        print_timings()
+        close_metrics()
+
+
+class PrefixedOutput:
+    # Writes to a stream, starting every line with a prefix
+    def __init__(self, stream, prefix):
+        self.stream = stream
+        self.prefix = prefix
+        self.at_line_start = True
+
+    def write(self, text):
+        for line in text.splitlines(True):
+            if self.at_line_start:
+                self.stream.write(self.prefix)
+            self.stream.write(line)
+            self.at_line_start = line.endswith("\n")
+        self.stream.flush()
+        return len(text)
+
+    def flush(self):
+        self.stream.flush()
+
+
+def get_account_name(config_path):
+    return os.path.splitext(os.path.basename(config_path))[0]
+
+
+def run_account(config_path, wait_for_start):
+    # Worker process entry point for one account
+    account = get_account_name(config_path)
+    sys.stdout = PrefixedOutput(sys.stdout, f"[{account}] ")
+    sys.exit(0 if run(config_path, account, wait_for_start) else 1)
+
+
+def start_account(config_path, wait_for_start=True):
+    process = multiprocessing.Process(target=run_account, args=(config_path, wait_for_start),
+                                      name=get_account_name(config_path))
+    process.start()
+    return process
+
+
+def run_accounts(config_paths, restart_limit=5, first_delay=5, max_delay=300, stable_time=600, poll=1):
+    # Runs one joiner process per config file and restarts the ones that crash. The delay before a restart
+    # doubles with every crash in a row, and an account is given up after restart_limit crashes in a row.
+    # A run that lasted stable_time seconds starts the count again
+    workers = {path: start_account(path) for path in config_paths}
+    started = {path: time.time() for path in config_paths}
+    crashes = {path: 0 for path in config_paths}
+    restart_at = {}  # unix time to restart each crashed account at
+    try:
+        while len(workers) > 0 or len(restart_at) > 0:
+            time.sleep(poll)
+            now = time.time()
+            for path, process in list(workers.items()):
+                if process.is_alive():
+                    continue
+                del workers[path]
+                account = get_account_name(path)
+                if process.exitcode == 0:
+                    print(f"[{account}] Stopped.")
+                    continue
+                if now - started[path] >= stable_time:
+                    crashes[path] = 0
+                crashes[path] += 1
+                if crashes[path] >= restart_limit:
+                    print(f"[{account}] Crashed {crashes[path]} times in a row "
+                          f"(exit code {process.exitcode}), giving up.")
+                    continue
+                delay = min(first_delay * 2 ** (crashes[path] - 1), max_delay)
+                print(f"[{account}] Crashed with exit code {process.exitcode}, restarting in {delay}s...")
+                restart_at[path] = now + delay
+
+            for path, restart_time in list(restart_at.items()):
+                if now >= restart_time:
+                    del restart_at[path]
+                    workers[path] = start_account(path, wait_for_start=False)
+                    started[path] = now
+    finally:
+        for process in workers.values():
+            process.terminate()
+
+
+simulation_log = None  # event log replayed by the simulation worker processes
+simulation_cache = {}  # member checks and leave results already simulated by this worker process
+
+
+def load_event_log(path):
+    # Reads the meetings, member counts and join latency recorded in an event log
+    cards = {}
+    members = {}
+    latencies = []
+    with open(path) as event_log:
+        for line in event_log:
+            event = json.loads(line)
+            # Ids of repeating meetings can be the same every day, so they are kept apart by day
+            if event['event'] == "card":
+                key = (date.fromtimestamp(event['start']), event['id'])
+                card = cards.setdefault(key, {'seen': event['t']})
+                card.update(title=event['title'], start=event['start'], end=event['end'])
+            elif event['event'] == "members":
+                # Only changes of the count are kept, the bot would read the same count until the next one
+                key = (date.fromtimestamp(event['t']), event['id'])
+                trace = members.setdefault(key, [])
+                if len(trace) == 0 or trace[-1][1] != event['count']:
+                    trace.append((event['t'], event['count']))
+            elif event['event'] == "join":
+                latencies.append(event['latency'])
+
+    latencies.sort()
+    return {
+        'meetings': [Meeting(f"{m_id}@{day.isoformat()}", card['start'], card['title'], card['end'])
+                     for (day, m_id), card in cards.items()],
+        'seen': {f"{m_id}@{day.isoformat()}": card['seen'] for (day, m_id), card in cards.items()},
+        'members': {f"{m_id}@{day.isoformat()}": trace for (day, m_id), trace in members.items()},
+        'member_times': {f"{m_id}@{day.isoformat()}": [t for t, _ in trace] for (day, m_id), trace in members.items()},
+        'latency': latencies[len(latencies) // 2] if latencies else 5,
+    }
+
+
+def member_checks(log, meeting, joined_at, member_interval):
+    # Member counts the bot would read every member_interval from joined_at until the meeting ends,
+    # as runs of (count, number of checks). The last count recorded before a check is used
+    key = ("checks", meeting.m_id, joined_at, member_interval)
+    if key in simulation_cache:
+        return simulation_cache[key]
+    trace = log['members'][meeting.m_id]
+    times = log['member_times'][meeting.m_id]
+    runs = []
+    i = bisect_right(times, joined_at)
+    t = joined_at
+    while t < meeting.time_ended:
+        count = trace[i - 1][1] if i > 0 else None
+        # The count stays the same until the next recorded one
+        changes_at = min(times[i], meeting.time_ended) if i < len(times) else meeting.time_ended
+        checks = math.ceil((changes_at - t) / member_interval)
+        if runs and runs[-1][0] == count:
+            runs[-1] = (count, runs[-1][1] + checks)
+        else:
+            runs.append((count, checks))
+        t += checks * member_interval
+        while i < len(times) and times[i] <= t:
+            i += 1
+    simulation_cache[key] = runs
+    return runs
+
+
+def simulate_leave(log, settings, meeting, joined_at):
+    # Returns when the bot would leave a meeting, and whether it left too early: whether the member count
+    # later went back above the limit of the rule that decided to leave
+    leave_time = meeting.time_ended
+    if settings.get('auto_leave_after_min', 0) > 0:
+        leave_time = min(leave_time, joined_at + settings['auto_leave_after_min'] * 60)
+    if (not settings.get('auto_leave', False) or meeting.auto_leave_blacklisted or
+            len(log['members'].get(meeting.m_id, [])) == 0):
+        return leave_time, False
+
+    history = new_member_history(settings)
+    member_interval = max(settings.get('member_interval', 10), 1)
+    # Grids often only change settings that do not affect this meeting, so the result is reused
+    key = ("leave", meeting.m_id, joined_at, leave_time, member_interval, history.leave_count, history.samples,
+           history.peak_percent, history.drop_count, history.counts.maxlen)
+    if key in simulation_cache:
+        return simulation_cache[key]
+
+    result = (leave_time, False)
+    checks = 0
+    for count, repeats in member_checks(log, meeting, joined_at, member_interval):
+        added = history.add_repeated(count, repeats)
+        if added is not None:
+            t = joined_at + (checks + added) * member_interval
+            if t < leave_time:
+                later = log['members'][meeting.m_id][bisect_right(log['member_times'][meeting.m_id], t):]
+                result = (t, any(count > history.limit for _, count in later))
+            break
+        checks += repeats
+        if joined_at + checks * member_interval >= leave_time:
+            break
+    simulation_cache[key] = result
+    return result
+
+
+def simulate(log, settings):
+    # Replays the meetings of an event log with the given settings, without a browser
+    check_interval = max(settings.get('check_interval', 20), 1)
+    offset = settings.get('join_early_offset', 60)
+    result = {'joined': 0, 'missed': 0, 'late': 0, 'lateness': 0, 'premature_leaves': 0}
+    meetings = log['meetings']
+    if len(meetings) == 0:
+        return result
+
+    seen = log['seen']
+    now = min(seen.values())
+    pending = [x for x in meetings if not x.blacklisted]
+    joined = set()
+    while True:
+        # The bot only knows about meetings whose cards it has seen
+        pending = [x for x in pending if x.time_ended > now]
+        candidates = [x for x in pending if seen[x.m_id] <= now and x.time_started - offset <= now]
+        meeting = choose_meeting(candidates, joined)
+        if meeting is None:
+            # Skip to the next scan that finds a meeting: its join time if its card was seen by then,
+            # otherwise the first check after the card appears
+            next_scan = None
+            for x in pending:
+                scan_time = x.time_started - offset
+                if seen[x.m_id] > now:
+                    scan_time = max(scan_time, now + math.ceil((seen[x.m_id] - now) / check_interval) * check_interval)
+                if scan_time < x.time_ended and (next_scan is None or scan_time < next_scan):
+                    next_scan = scan_time
+            if next_scan is None:
+                break
+            now = next_scan
+            continue
+
+        pending.remove(meeting)
+        joined_at = now + log['latency']
+        if joined_at >= meeting.time_ended:
+            continue
+        joined.add(meeting.m_id)
+        result['joined'] += 1
+        if joined_at > meeting.time_started:
+            result['late'] += 1
+            result['lateness'] += joined_at - meeting.time_started
+
+        now, premature = simulate_leave(log, settings, meeting, joined_at)
+        if premature:
+            result['premature_leaves'] += 1
+
+    result['missed'] = len([x for x in meetings if not x.blacklisted and x.m_id not in joined])
+    return result
+
+
+def init_simulation(log):
+    global simulation_log
+    simulation_log = log
+    simulation_cache.clear()
+
+
+def simulate_settings(settings):
+    return settings, simulate(simulation_log, settings)
+
+
+def run_simulation(log_path, grid_args):
+    # Replays an event log with every combination of the given settings and prints the best ones
+    log = load_event_log(log_path)
+    grid = {}
+    for arg in grid_args:
+        key, _, values = arg.partition("=")
+        grid[key] = [json.loads(value) for value in values.split(",")]
+    keys = list(grid)
+    combos = [{**config, **dict(zip(keys, values))} for values in itertools.product(*grid.values())]
+
+    start = time.time()
+    with multiprocessing.Pool(initializer=init_simulation, initargs=(log,)) as pool:
+        chunk_size = max(1, len(combos) // (4 * (os.cpu_count() or 1)))
+        results = pool.map(simulate_settings, combos, chunksize=chunk_size)
+    print(f"Simulated {len(combos)} setting(s) for {len(log['meetings'])} meeting(s) "
+          f"in {time.time() - start:.1f}s\n")
+
+    results.sort(key=lambda x: (x[1]['missed'], x[1]['premature_leaves'], x[1]['late'], x[1]['lateness']))
+    for settings, result in results[:20]:
+        label = ", ".join(f"{key}={settings[key]}" for key in keys) or "current config"
+        late = f"{result['late']} late"
+        if result['late'] > 0:
+            late += f" (avg {result['lateness'] / result['late']:.0f}s)"
+        print(f"{label}: {result['joined']} joined, {result['missed']} missed, {late}, "
+              f"{result['premature_leaves']} premature leaves")
+
+
+def prevent_sleep():
+    # Prevent computer from sleeping while script is running
+    if sys.platform == "win32":
+        import ctypes
+        ctypes.windll.kernel32.SetThreadExecutionState(0x80000001)
+    elif sys.platform == "darwin":
+        subprocess.Popen(["caffeinate", "-i", "-w", str(os.getpid())])
+
+
+def check_config(config_path):
+    # Checks a config file without starting a browser. Returns True if no problems were found
+    try:
+        load_config(config_path)
+    except OSError as e:
+        print(f"{config_path}: could not be read:", e)
+        return False
+    except re.error as e:
+        print(f"{config_path}: invalid blacklist regular expression:", e)
+        return False
+    except (ValueError, TypeError) as e:
+        print(f"{config_path}:", e)
+        return False
+
+    problems = []
+    types = {
+        'email': str, 'password': str, 'run_at_time': str, 'chrome_type': str, 'join_sound': str,
+        'joined_file': str, 'profile_dir': str, 'driver_path': str, 'calendar_source': str,
+        'metrics_file': str, 'teams_url': str, 'event_log': str, 'blacklist_schedule': list,
+        'random_delay': bool, 'headless': bool, 'mute_audio': bool, 'auto_leave': bool,
+        'watch_page': bool, 'low_resource': bool,
+        'check_interval': (int, float), 'member_interval': (int, float), 'join_early_offset': (int, float),
+        'auto_leave_after_min': (int, float), 'auto_leave_count': int, 'auto_leave_samples': int,
+        'auto_leave_peak_percent': (int, float), 'auto_leave_drop_count': int, 'auto_leave_drop_window': int,
+        'window_width': int, 'window_height': int, 'calendar_days': int, 'metrics_port': int,
+        'resource_report_interval': (int, float),
+    }
+    for key, expected in types.items():
+        if key in config and (not isinstance(config[key], expected) or
+                              (expected is not bool and isinstance(config[key], bool))):
+            problems.append(f"{key} has the wrong type: {config[key]!r}")
+    for key in ('email', 'password'):
+        if key not in config:
+            problems.append(f"{key} is missing")
+
+    if isinstance(config.get('run_at_time'), str) and config['run_at_time'] != "":
+        try:
+            datetime.strptime(config['run_at_time'], "%H:%M")
+        except ValueError:
+            problems.append(f"run_at_time is not in HH:MM format: {config['run_at_time']}")
+    if config.get('chrome_type', "google-chrome") not in ("google-chrome", "chromium", "msedge"):
+        problems.append(f"chrome_type is not google-chrome, chromium or msedge: {config['chrome_type']}")
+    for key in ('join_sound', 'driver_path'):
+        if isinstance(config.get(key), str) and config[key] != "" and not os.path.isfile(config[key]):
+            problems.append(f"{key} file does not exist: {config[key]}")
+
+    for problem in problems:
+        print(f"{config_path}: {problem}")
+    if len(problems) == 0:
+        print(f"{config_path}: OK")
+    return len(problems) == 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Automatically join Microsoft Teams meetings.")
+    parser.add_argument("configs", nargs="*", default=["config.json"],
+                        help="config file(s) to use, one per account (default: config.json)")
+    parser.add_argument("--check-config", action="store_true",
+                        help="check the config file(s) and exit without starting a browser")
+    parser.add_argument("--simulate", metavar="EVENT_LOG",
+                        help="replay an event_log with the config settings and exit without starting a browser")
+    parser.add_argument("--grid", metavar="KEY=VALUES", action="append", default=[],
+                        help="comma separated values of a setting to try with --simulate, "
+                             "for example check_interval=10,20,30")
+    args = parser.parse_args()
+
+    if args.check_config:
+        results = [check_config(path) for path in args.configs]
+        sys.exit(0 if all(results) else 1)
+
+    if args.simulate:
+        load_config(args.configs[0])
+        run_simulation(args.simulate, args.grid)
+        sys.exit(0)
+
+    prevent_sleep()
+
+    if len(args.configs) > 1:
+        run_accounts(args.configs)
+    else:
+        try:
+            run(args.configs[0])
+        finally:
+            if sys.stdin.isatty():
+                input("Push enter to exit.")
@@ -0,0 +1,28 @@
+import pytest
+
+import auto_joiner
+
+
+@pytest.fixture(autouse=True)
+def joiner(monkeypatch):
+    # Gives every test an empty config and fresh module state
+    monkeypatch.setattr(auto_joiner, "config", {})
+    monkeypatch.setattr(auto_joiner, "blacklist_meeting_patterns", [])
+    monkeypatch.setattr(auto_joiner, "whitelist_meeting_patterns", [])
+    monkeypatch.setattr(auto_joiner, "auto_leave_blacklist_patterns", [])
+    monkeypatch.setattr(auto_joiner, "blacklist_schedule_rules", [])
+    monkeypatch.setattr(auto_joiner, "meetings", [])
+    monkeypatch.setattr(auto_joiner, "calendar_index", {})
+    monkeypatch.setattr(auto_joiner, "calendar_day", None)
+    monkeypatch.setattr(auto_joiner, "current_meeting", None)
+    monkeypatch.setattr(auto_joiner, "already_joined_ids", set())
+    monkeypatch.setattr(auto_joiner, "joined_day", None)
+    monkeypatch.setattr(auto_joiner, "join_early_offset", 0)
+    monkeypatch.setattr(auto_joiner, "join_deadlines", [])
+    monkeypatch.setattr(auto_joiner, "last_scan_time", 0)
+    monkeypatch.setattr(auto_joiner, "join_delays", {})
+    monkeypatch.setattr(auto_joiner, "leave_at", None)
+    monkeypatch.setattr(auto_joiner, "join_urls", {})
+    auto_joiner.check_blacklist.cache_clear()
+    yield auto_joiner
+    auto_joiner.check_blacklist.cache_clear()
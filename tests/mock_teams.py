@@ -0,0 +1,44 @@
+import json
+import os
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+
+PAGE_FILE = os.path.join(os.path.dirname(__file__), "mock_teams.html")
+
+
+class MockTeams:
+    # Serves the mock Teams page on a local port, with the given meetings in the calendar
+    def __init__(self):
+        with open(PAGE_FILE, encoding="utf-8") as page_file:
+            self.page = page_file.read()
+        self.meetings = []  # {"id", "title", "start" in minutes from midnight, "duration" in minutes}
+        self.members = 0
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                # Every path is the Teams app, the page picks the view from the URL fragment
+                data = json.dumps({'meetings': mock.meetings, 'members': mock.members})
+                body = mock.page.replace("{/*MOCK_DATA*/}", data).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/"
+        Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def set_meetings(self, count, members=10):
+        # Fills the calendar with count meetings of 30 minutes, one every 7 minutes from midnight
+        self.meetings = [{'id': f"mock-meeting-{i}", 'title': f"Mock meeting {i}", 'start': i * 7, 'duration': 30}
+                         for i in range(count)]
+        self.members = members
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,107 @@
+import json
+import time
+from datetime import datetime
+
+import pytest
+
+
+@pytest.fixture
+def load(joiner, tmp_path):
+    # Loads a config with the given settings
+    def load_config(**settings):
+        path = tmp_path / "config.json"
+        path.write_text(json.dumps(settings))
+        joiner.load_config(str(path))
+    return load_config
+
+
+def at(text):
+    return int(datetime.strptime(text, "%Y-%m-%d %H:%M").timestamp())
+
+
+def test_blacklist_with_inline_flags(joiner, load):
+    load(blacklist_meeting_re="(?i)cura|free period", auto_leave_blacklist_re=["^Assembly$", ""])
+    assert joiner.check_blacklist("CURA check-in") == (True, False)
+    assert joiner.check_blacklist("Free Period") == (True, False)
+    assert joiner.check_blacklist("Assembly") == (False, True)
+    assert joiner.check_blacklist("Maths") == (False, False)
+
+
+def test_missing_title_is_blacklisted(joiner, load):
+    load()
+    assert joiner.check_blacklist(None) == (True, True)
+
+
+def test_whitelist(joiner, load):
+    load(whitelist_meeting_re=["^Maths", "^English"], blacklist_meeting_re="Test")
+    assert not joiner.Meeting("a", at("2021-03-01 09:00"), "Maths B").blacklisted
+    assert joiner.Meeting("b", at("2021-03-01 09:00"), "History").blacklisted
+    assert joiner.Meeting("c", at("2021-03-01 09:00"), "English Test").blacklisted
+
+
+def test_blacklist_schedule(joiner, load):
+    # 2021-03-03 is a Wednesday
+    load(blacklist_schedule=[{"days": ["Wed"], "from": "12:00", "to": "13:30", "title_re": "Advisory"},
+                             {"days": ["Friday"]}])
+    assert joiner.Meeting("a", at("2021-03-03 12:15"), "Advisory").blacklisted
+    assert not joiner.Meeting("b", at("2021-03-03 13:30"), "Advisory").blacklisted
+    assert not joiner.Meeting("c", at("2021-03-03 12:15"), "Maths").blacklisted
+    assert not joiner.Meeting("d", at("2021-03-04 12:15"), "Advisory").blacklisted
+    assert joiner.Meeting("e", at("2021-03-05 08:00"), "Maths").blacklisted
+
+
+@pytest.mark.parametrize("rule", [{"days": ["Someday"]}, {"from": "noon"}, {"days": "Wed"}, "Wed"])
+def test_invalid_schedule_rule(load, rule):
+    with pytest.raises(ValueError):
+        load(blacklist_schedule=[rule])
+
+
+def test_blacklist_schedule_until_end_of_day(joiner, load):
+    load(blacklist_schedule=[{"days": ["Wed"], "from": "23:00"}, {"days": ["Thu"], "from": "20:00", "to": "24:00"}])
+    assert joiner.Meeting("a", at("2021-03-03 23:59"), "Late").blacklisted
+    assert joiner.Meeting("b", at("2021-03-04 23:59"), "Late").blacklisted
+    assert not joiner.Meeting("c", at("2021-03-04 00:00"), "Early").blacklisted
+
+
+def test_blacklist_schedule_past_midnight(joiner, load):
+    # Friday 22:00 until Saturday 06:00, and every night for the rule without days
+    load(blacklist_schedule=[{"days": ["Fri"], "from": "22:00", "to": "06:00", "title_re": "Gaming"},
+                             {"from": "23:30", "to": "00:30", "title_re": "Night"}])
+    assert joiner.Meeting("a", at("2021-03-05 22:00"), "Gaming").blacklisted
+    assert joiner.Meeting("b", at("2021-03-06 05:59"), "Gaming").blacklisted
+    assert not joiner.Meeting("c", at("2021-03-06 06:00"), "Gaming").blacklisted
+    assert not joiner.Meeting("d", at("2021-03-05 05:00"), "Gaming").blacklisted
+    assert not joiner.Meeting("e", at("2021-03-06 22:30"), "Gaming").blacklisted
+    assert joiner.Meeting("f", at("2021-03-01 00:15"), "Night").blacklisted
+    assert joiner.Meeting("g", at("2021-03-07 23:45"), "Night").blacklisted
+    assert not joiner.Meeting("h", at("2021-03-07 12:00"), "Night").blacklisted
+
+
+def test_blacklist_benchmark(joiner, load, capsys):
+    # Per-scan cost of the blacklist for thousands of different titles, and for a calendar scanned again
+    load(blacklist_meeting_re=["(?i)cura", "Free Period", "^Office hours"], whitelist_meeting_re=["Period \\d", "Club"],
+         auto_leave_blacklist_re="Assembly|Breakout",
+         blacklist_schedule=[{"days": ["Wed"], "from": "12:00", "to": "13:30", "title_re": "Advisory"},
+                             {"days": ["Fri"], "from": "22:00", "to": "06:00"}])
+    start_time = at("2021-03-01 08:00")
+    titles = [f"Period {i % 8} {['Maths', 'Cura', 'Assembly', 'Club', 'Advisory'][i % 5]} {i}" for i in range(5000)]
+
+    start = time.perf_counter()
+    for i, title in enumerate(titles):
+        joiner.Meeting(str(i), start_time + i * 60, title)
+    first_scan = (time.perf_counter() - start) / len(titles)
+
+    # A day's calendar of 200 meetings, read again on every scan
+    calendar = [(str(i), start_time + i * 300, titles[i]) for i in range(200)]
+    for m_id, time_started, title in calendar:
+        joiner.Meeting(m_id, time_started, title)
+    start = time.perf_counter()
+    for _ in range(10):
+        for m_id, time_started, title in calendar:
+            joiner.Meeting(m_id, time_started, title)
+    rescan = (time.perf_counter() - start) / (10 * len(calendar))
+
+    with capsys.disabled():
+        print(f"\nblacklist: {first_scan * 1e6:.1f}us per new title, {rescan * 1e6:.1f}us per cached title")
+    assert first_scan < 0.001
+    assert rescan < first_scan
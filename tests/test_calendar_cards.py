@@ -0,0 +1,28 @@
+import pytest
+
+from auto_joiner import parse_meeting_card
+
+MIDNIGHT = 1_600_000_000
+
+
+@pytest.mark.parametrize("style, start_minutes, duration_minutes", [
+    # 0.135rem per minute from midnight, height in percent of the day
+    ("top: 0rem; height: 4.16667%;", 0, 60),
+    ("top: 108rem; height: 4.16667%;", 800, 60),
+    ("top: 110.025rem; height: 2.08333%;", 815, 30),
+    ("top: 189rem; height: 6.25%;", 1400, 90),
+    # 64.8 / 0.135 is just below 480 in floating point
+    ("top: 64.8rem; height: 3.47222%;", 480, 50),
+    # Other properties around the position, as set by the mock Teams page
+    ("top: 8.1rem; height: 2.08333%; left: 24%;", 60, 30),
+    ("left: 0%; top: 8.1rem; min-height: 1px; height: 2.08333%; width: 100%", 60, 30),
+])
+def test_parse_meeting_card(style, start_minutes, duration_minutes):
+    start_time, end_time = parse_meeting_card(style, MIDNIGHT)
+    assert start_time == MIDNIGHT + start_minutes * 60
+    assert end_time == start_time + duration_minutes * 60
+
+
+def test_parse_meeting_card_without_position():
+    with pytest.raises(ValueError):
+        parse_meeting_card("display: none;", MIDNIGHT)
@@ -0,0 +1,95 @@
+import time
+from datetime import date, datetime, timedelta
+
+import pytest
+
+
+@pytest.fixture
+def calendar(joiner, monkeypatch):
+    # Makes get_calendar_meetings() read the entries in calendar.entries
+    class Calendar:
+        entries = {}
+
+    fake = Calendar()
+    monkeypatch.setattr(joiner, "read_meetings", lambda: fake.entries)
+    monkeypatch.setattr(joiner, "metrics", {})
+    return fake
+
+
+def test_changes_are_reported(joiner, calendar, capsys):
+    now = int(time.time())
+    calendar.entries = {'a': (now + 600, now + 1200, "Maths", None), 'b': (now + 1800, now + 2400, "English", None)}
+    assert joiner.get_calendar_meetings()
+    assert "Upcoming meetings" in capsys.readouterr().out
+
+    calendar.entries = {'a': (now + 900, now + 1200, "Maths", None), 'c': (now + 3000, now + 3600, "Art", None)}
+    assert joiner.get_calendar_meetings()
+    out = capsys.readouterr().out
+    assert "Meeting changed in calendar: Maths" in out
+    assert "Meeting removed from calendar: English" in out
+    assert "Meeting added to calendar: Art" in out
+    assert sorted(joiner.calendar_index) == ['a', 'c']
+    assert joiner.calendar_index['a'].time_started == now + 900
+
+
+def test_empty_calendar_removes_the_last_meeting(joiner, calendar):
+    now = int(time.time())
+    calendar.entries = {'a': (now + 600, now + 1200, "Maths", None)}
+    joiner.join_urls['a'] = "https://teams.microsoft.com/_#/l/meetup-join/a"
+    assert joiner.get_calendar_meetings()
+    assert joiner.join_deadlines == [(now + 600, 'a')]
+
+    calendar.entries = {}
+    assert joiner.get_calendar_meetings()
+    assert joiner.calendar_index == {}
+    assert joiner.join_deadlines == []
+    assert joiner.join_urls == {}
+
+
+def test_failed_read_keeps_the_index(joiner, calendar):
+    now = int(time.time())
+    calendar.entries = {'a': (now + 600, now + 1200, "Maths", None)}
+    assert joiner.get_calendar_meetings()
+
+    calendar.entries = None
+    assert not joiner.get_calendar_meetings()
+    assert list(joiner.calendar_index) == ['a']
+
+
+def test_current_meetings_are_listed(joiner, calendar):
+    now = int(time.time())
+    calendar.entries = {'a': (now - 60, now + 1200, "Maths", None), 'b': (now - 1200, now - 60, "English", None)}
+    assert joiner.get_calendar_meetings()
+    assert [x.m_id for x in joiner.meetings] == ['a']
+    assert joiner.join_deadlines == []
+
+
+def test_upcoming_meetings_of_the_next_days(joiner, calendar):
+    midnight = datetime.combine(date.today(), datetime.min.time())
+    later = int(time.time()) + 60
+
+    def entry(days, title):
+        start = max(int((midnight + timedelta(days=days, hours=23)).timestamp()), later)
+        return start, start + 1800, title, None
+
+    calendar.entries = {'today': entry(0, "Today"), 'tomorrow': entry(1, "Tomorrow"), 'after': entry(2, "After")}
+    assert joiner.get_calendar_meetings()
+    assert [x.m_id for x in joiner.get_upcoming_meetings()] == ['today']
+
+    joiner.config['calendar_days'] = 3
+    assert [x.m_id for x in joiner.get_upcoming_meetings()] == ['today', 'tomorrow', 'after']
+    assert [x.m_id for x in joiner.get_upcoming_meetings(2)] == ['today', 'tomorrow']
+
+
+def test_new_day_forgets_ended_meetings(joiner, calendar, capsys):
+    now = int(time.time())
+    calendar.entries = {'old': (now - 3 * 86400, now - 3 * 86400 + 1800, "Old", None),
+                        'next': (now + 600, now + 1200, "Next", None)}
+    assert joiner.get_calendar_meetings()
+
+    # The first scan of a day drops meetings of previous days without reporting them
+    joiner.calendar_day = date.today() - timedelta(days=1)
+    calendar.entries = {'next': (now + 600, now + 1200, "Next", None)}
+    assert joiner.get_calendar_meetings()
+    assert "removed" not in capsys.readouterr().out
+    assert list(joiner.calendar_index) == ['next']
@@ -0,0 +1,100 @@
+import os
+from datetime import date, datetime
+from html.parser import HTMLParser
+
+import pytest
+
+SNAPSHOT_DIR = os.path.join(os.path.dirname(__file__), "snapshots")
+
+
+class CardParser(HTMLParser):
+    # Reads the cards of a saved calendar page the way CALENDAR_CARDS_SCRIPT does in the browser
+    def __init__(self):
+        super().__init__()
+        self.cards = []
+        self.card_depth = None
+        self.depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        self.depth += 1
+        if tag != "div":
+            return
+        if "multi-day-renderer__eventCard" in attrs.get('class', ""):
+            self.cards.append({'style': attrs.get('style', ""), 'title': None, 'id': None})
+            self.card_depth = self.depth
+        elif self.card_depth == self.depth - 1 and self.cards[-1]['title'] is None:
+            self.cards[-1]['title'] = attrs.get('title')
+            self.cards[-1]['id'] = attrs.get('id')
+
+    def handle_endtag(self, tag):
+        if self.depth == self.card_depth:
+            self.card_depth = None
+        self.depth -= 1
+
+
+def snapshot_cards(name):
+    parser = CardParser()
+    with open(os.path.join(SNAPSHOT_DIR, name), encoding="utf-8") as snapshot:
+        parser.feed(snapshot.read())
+    return parser.cards
+
+
+@pytest.fixture
+def teams_page(joiner, monkeypatch):
+    # Makes read_teams_calendar() read the cards of page.snapshot instead of a browser
+    class Page:
+        snapshot = None
+
+        def execute_script(self, script, *args):
+            assert script == joiner.CALENDAR_CARDS_SCRIPT
+            return snapshot_cards(self.snapshot)
+
+    page = Page()
+    monkeypatch.setattr(joiner, "browser", page)
+    monkeypatch.setattr(joiner, "switch_to_calendar_tab", lambda: True)
+    monkeypatch.setattr(joiner, "wait_until_found", lambda selector, timeout: object())
+    monkeypatch.setattr(joiner, "metrics", {})
+    return page
+
+
+def minutes(count):
+    midnight = datetime.combine(date.today(), datetime.min.time())
+    return int(midnight.timestamp()) + count * 60
+
+
+def test_snapshot_cards():
+    cards = snapshot_cards("day_view_before.html")
+    assert [x['id'] for x in cards] == ["AAMkADdhYjM1-period1", "AAMkADdhYjM1-period2", "AAMkADdhYjM1-advisory",
+                                        "AAMkADdhYjM1-period3", None]
+    assert cards[1] == {'style': "top: 72.9rem; height: 3.47222%;", 'title': "English 11\nHonors",
+                        'id': "AAMkADdhYjM1-period2"}
+
+
+def test_read_day_view(joiner, teams_page):
+    teams_page.snapshot = "day_view_before.html"
+    entries = joiner.read_teams_calendar()
+
+    # The all day card has no id and is not a meeting
+    assert sorted(entries) == ["AAMkADdhYjM1-advisory", "AAMkADdhYjM1-period1", "AAMkADdhYjM1-period2",
+                               "AAMkADdhYjM1-period3"]
+    assert entries["AAMkADdhYjM1-period1"] == (minutes(480), minutes(530), "AP Calculus BC", None)
+    assert entries["AAMkADdhYjM1-period2"] == (minutes(540), minutes(590), "English 11 Honors", None)
+    assert entries["AAMkADdhYjM1-advisory"] == (minutes(600), minutes(630), "Advisory", None)
+
+
+def test_day_view_changes(joiner, teams_page, capsys):
+    teams_page.snapshot = "day_view_before.html"
+    assert joiner.get_calendar_meetings()
+    capsys.readouterr()
+
+    teams_page.snapshot = "day_view_after.html"
+    assert joiner.get_calendar_meetings()
+    out = capsys.readouterr().out
+    assert "Meeting changed in calendar: English 11 Honors" in out
+    assert "Meeting removed from calendar: Advisory" in out
+    assert "Meeting added to calendar: Office hours" in out
+    assert "AP Calculus BC" not in out
+    assert sorted(joiner.calendar_index) == ["AAMkADdhYjM1-office-hours", "AAMkADdhYjM1-period1",
+                                             "AAMkADdhYjM1-period2", "AAMkADdhYjM1-period3"]
+    assert joiner.calendar_index["AAMkADdhYjM1-period2"].time_started == minutes(570)
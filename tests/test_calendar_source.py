@@ -0,0 +1,193 @@
+import json
+from datetime import date, datetime, timezone
+
+import pytest
+
+from auto_joiner import ics_occurs_on, read_ics_calendar, read_json_calendar
+
+URL = "https://teams.microsoft.com/l/meetup-join/19%3ameeting_abc%40thread.v2/0"
+
+ICS = "\r\n".join([
+    "BEGIN:VCALENDAR",
+    # Every Monday and Wednesday, with a Wednesday cancelled and a Monday moved
+    "BEGIN:VEVENT",
+    "UID:maths",
+    "SUMMARY:Maths",
+    "DTSTART;TZID=W. Europe Standard Time:20210301T090000",
+    "DTEND;TZID=W. Europe Standard Time:20210301T095000",
+    "RRULE:FREQ=WEEKLY;BYDAY=MO,WE",
+    "EXDATE;VALUE=DATE:20210310",
+    "X-MICROSOFT-SKYPETEAMSMEETINGURL:" + URL[:40],
+    " " + URL[40:],
+    "END:VEVENT",
+    "BEGIN:VEVENT",
+    "UID:maths",
+    "SUMMARY:Maths (moved)",
+    "RECURRENCE-ID;TZID=W. Europe Standard Time:20210315T090000",
+    "DTSTART;TZID=W. Europe Standard Time:20210315T110000",
+    "DTEND;TZID=W. Europe Standard Time:20210315T115000",
+    "END:VEVENT",
+    # Every other day, three times
+    "BEGIN:VEVENT",
+    "UID:art",
+    "SUMMARY:Art\\, Design",
+    "DTSTART;VALUE=DATE-TIME:20210302T130000",
+    "DTEND;VALUE=DATE-TIME:20210302T140000",
+    "RRULE:FREQ=DAILY;INTERVAL=2;COUNT=3",
+    "EXDATE;VALUE=DATE-TIME:20210304T130000",
+    "DESCRIPTION:Join here <" + URL + ">",
+    "END:VEVENT",
+    # All day events are not meetings
+    "BEGIN:VEVENT",
+    "UID:holiday",
+    "SUMMARY:Holiday",
+    "DTSTART;VALUE=DATE:20210301",
+    "END:VEVENT",
+    "END:VCALENDAR",
+]) + "\r\n"
+
+
+def test_weekly_event_with_folded_url():
+    entries = read_ics_calendar(ICS, date(2021, 3, 1))
+    start = int(datetime(2021, 3, 1, 9, 0).timestamp())
+    assert entries == {'maths': (start, start + 50 * 60, "Maths", URL)}
+
+    assert "maths" in read_ics_calendar(ICS, date(2021, 3, 3))
+    assert read_ics_calendar(ICS, date(2021, 3, 2)).keys() == {"art"}
+    assert read_ics_calendar(ICS, date(2021, 2, 22)) == {}
+
+
+def test_all_day_exdate():
+    assert "maths" not in read_ics_calendar(ICS, date(2021, 3, 10))
+    assert "maths" in read_ics_calendar(ICS, date(2021, 3, 8))
+
+
+def test_moved_repetition_keeps_the_series_url():
+    entries = read_ics_calendar(ICS, date(2021, 3, 15))
+    start = int(datetime(2021, 3, 15, 11, 0).timestamp())
+    assert entries == {'maths': (start, start + 50 * 60, "Maths (moved)", URL)}
+
+
+def test_daily_interval_count_and_exdate():
+    days = [day for day in range(1, 12) if "art" in read_ics_calendar(ICS, date(2021, 3, day))]
+    assert days == [2, 6]
+    assert read_ics_calendar(ICS, date(2021, 3, 2))['art'][2:] == ("Art, Design", URL)
+
+
+def test_invalid_dates_are_skipped():
+    text = ICS.replace("EXDATE;VALUE=DATE:20210310", "EXDATE;VALUE=DATE:2021-03-10") \
+        .replace("RECURRENCE-ID;TZID=W. Europe Standard Time:20210315T090000", "RECURRENCE-ID:soon")
+    assert "maths" in read_ics_calendar(text, date(2021, 3, 10))
+    assert read_ics_calendar(text, date(2021, 3, 15))['maths'][2] == "Maths"
+
+
+def test_ics_occurs_on():
+    event = {'start': datetime(2021, 3, 1, 9), 'exdates': {date(2021, 3, 15)},
+             'rrule': "FREQ=WEEKLY;INTERVAL=2;UNTIL=20210401T000000Z"}
+    assert [day for day in range(1, 32) if ics_occurs_on(event, date(2021, 3, day))] == [1, 29]
+
+    event['rrule'] = "FREQ=MONTHLY"
+    assert not ics_occurs_on(event, date(2021, 4, 1))
+
+    del event['rrule']
+    assert ics_occurs_on(event, date(2021, 3, 1))
+    assert not ics_occurs_on(event, date(2021, 3, 2))
+
+
+def test_json_calendar():
+    text = json.dumps([
+        {"id": 1, "title": "Maths", "start": "2021-03-01T09:00:00", "end": "2021-03-01T09:50:00", "url": URL},
+        {"id": "art", "start": "2021-03-02T13:00:00", "end": "2021-03-02T14:00:00"},
+    ])
+    start = int(datetime(2021, 3, 1, 9, 0).timestamp())
+    assert read_json_calendar(text, date(2021, 3, 1)) == {'1': (start, start + 50 * 60, "Maths", URL)}
+    assert read_json_calendar(text, date(2021, 3, 2))['art'][2:] == (None, None)
+
+
+def test_read_meetings_from_a_file(joiner, tmp_path):
+    path = tmp_path / "calendar.json"
+    today = date.today()
+    path.write_text(json.dumps([{"id": "a", "title": "Maths", "start": f"{today}T09:00:00", "end": f"{today}T09:50:00"}]))
+    joiner.config['calendar_source'] = str(path)
+    joiner.config['calendar_days'] = 2
+    assert list(joiner.read_meetings()) == [f"a@{today.isoformat()}"]
+
+    path.write_text("[{\"id\": \"a\"}]")
+    assert joiner.read_meetings() is None
+
+
+def test_meetings_without_link_are_not_joined(joiner, tmp_path, monkeypatch):
+    path = tmp_path / "calendar.json"
+    today = date.today()
+    path.write_text(json.dumps([
+        {"id": "a", "title": "Maths", "start": f"{today}T09:00:00", "end": f"{today}T09:50:00", "url": URL},
+        {"id": "b", "title": "Dentist", "start": f"{today}T09:10:00", "end": f"{today}T09:40:00"},
+    ]))
+    joiner.config['calendar_source'] = str(path)
+    monkeypatch.setattr(joiner, "metrics", {})
+    monkeypatch.setattr(joiner, "switch_to_calendar_tab", lambda: pytest.fail("opened the Teams calendar"))
+    assert joiner.get_calendar_meetings()
+
+    linked = joiner.calendar_index[f"a@{today.isoformat()}"]
+    linkless = joiner.calendar_index[f"b@{today.isoformat()}"]
+    assert not linked.blacklisted
+    assert linkless.blacklisted
+    assert joiner.resolve_join_url(linkless) is None
+    assert joiner.choose_meeting([linked, linkless], set()) is linked
+
+
+def test_repetition_moved_to_a_day_of_the_series():
+    # The Monday 2021-03-22 class moved to Wednesday 14:00, where the series also takes place at 09:00
+    text = ICS.replace("END:VCALENDAR", "\r\n".join([
+        "BEGIN:VEVENT",
+        "UID:maths",
+        "SUMMARY:Maths (extra)",
+        "RECURRENCE-ID;TZID=W. Europe Standard Time:20210322T090000",
+        "DTSTART;TZID=W. Europe Standard Time:20210324T140000",
+        "DURATION:PT1H15M",
+        "END:VEVENT",
+        "END:VCALENDAR"]))
+    entries = read_ics_calendar(text, date(2021, 3, 24))
+    start = int(datetime(2021, 3, 24, 14, 0).timestamp())
+    assert entries['maths/2021-03-22'] == (start, start + 75 * 60, "Maths (extra)", URL)
+    assert entries['maths'][2] == "Maths"
+    assert read_ics_calendar(text, date(2021, 3, 22)) == {}
+
+
+def test_duration():
+    text = ICS.replace("DTEND;VALUE=DATE-TIME:20210302T140000", "DURATION:PT1H30M")
+    start, end = read_ics_calendar(text, date(2021, 3, 2))['art'][:2]
+    assert end - start == 90 * 60
+
+    # Without DTEND or a readable DURATION meetings take an hour
+    text = ICS.replace("DTEND;VALUE=DATE-TIME:20210302T140000", "DURATION:soon")
+    start, end = read_ics_calendar(text, date(2021, 3, 2))['art'][:2]
+    assert end - start == 60 * 60
+
+
+def test_graph_calendar_view():
+    text = json.dumps({
+        "@odata.context": "https://graph.microsoft.com/v1.0/$metadata#users('me')/calendarView",
+        "value": [
+            {"id": "AAMkAG1=", "subject": "Maths", "isAllDay": False, "isCancelled": False,
+             "start": {"dateTime": "2021-03-01T08:00:00.0000000", "timeZone": "UTC"},
+             "end": {"dateTime": "2021-03-01T08:50:00.0000000", "timeZone": "UTC"},
+             "onlineMeeting": {"joinUrl": URL}},
+            {"id": "AAMkAG2=", "subject": "Art", "isAllDay": False, "isCancelled": False,
+             "start": {"dateTime": "2021-03-01T13:00:00.0000000", "timeZone": "W. Europe Standard Time"},
+             "end": {"dateTime": "2021-03-01T14:00:00.0000000", "timeZone": "W. Europe Standard Time"},
+             "onlineMeeting": None},
+            {"id": "AAMkAG3=", "subject": "Cancelled", "isCancelled": True,
+             "start": {"dateTime": "2021-03-01T10:00:00.0000000", "timeZone": "UTC"},
+             "end": {"dateTime": "2021-03-01T11:00:00.0000000", "timeZone": "UTC"}},
+            {"id": "AAMkAG4=", "subject": "Holiday", "isAllDay": True,
+             "start": {"dateTime": "2021-03-01T00:00:00.0000000", "timeZone": "UTC"},
+             "end": {"dateTime": "2021-03-02T00:00:00.0000000", "timeZone": "UTC"}},
+        ]})
+    entries = read_json_calendar(text, date(2021, 3, 1))
+    assert entries.keys() == {"AAMkAG1=", "AAMkAG2="}
+
+    start = int(datetime(2021, 3, 1, 8, 0, tzinfo=timezone.utc).timestamp())
+    assert entries["AAMkAG1="] == (start, start + 50 * 60, "Maths", URL)
+    start = int(datetime(2021, 3, 1, 13, 0).timestamp())
+    assert entries["AAMkAG2="] == (start, start + 60 * 60, "Art", None)
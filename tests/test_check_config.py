@@ -0,0 +1,52 @@
+import json
+import os
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def check(joiner, tmp_path):
+    # Checks a config file with the given contents
+    def check_config(text):
+        path = tmp_path / "config.json"
+        path.write_text(text if isinstance(text, str) else json.dumps(text))
+        return joiner.check_config(str(path))
+    return check_config
+
+
+def test_valid_config(check, capsys, monkeypatch):
+    # The example's join_sound is relative to the repository folder
+    monkeypatch.chdir(REPO_DIR)
+    with open("config.json.example") as example:
+        assert check(example.read())
+    assert capsys.readouterr().out.endswith("OK\n")
+
+
+@pytest.mark.parametrize("text, message", [
+    ("[1, 2]", "must be a JSON object"),
+    ("\"email\"", "must be a JSON object"),
+    ("{\"email\": ", "Expecting value"),
+    ({'email': "", 'password': "", 'blacklist_meeting_re': 5}, "blacklist_meeting_re must be a regular expression"),
+    ({'email': "", 'password': "", 'whitelist_meeting_re': ["ok", None]}, "whitelist_meeting_re must be"),
+    ({'email': "", 'password': "", 'auto_leave_blacklist_re': {"a": 1}}, "auto_leave_blacklist_re must be"),
+    ({'email': "", 'password': "", 'blacklist_meeting_re': "(unclosed"}, "invalid blacklist regular expression"),
+    ({'email': "", 'password': "", 'blacklist_schedule': 5}, "blacklist_schedule must be a list"),
+    ({'email': "", 'password': "", 'blacklist_schedule': [{"days": 5}]}, "invalid blacklist_schedule rule"),
+    ({'email': "", 'password': "", 'check_interval': "30"}, "check_interval has the wrong type"),
+    ({'email': "", 'password': "", 'headless': 1}, "headless has the wrong type"),
+    ({'email': "", 'password': "", 'auto_leave_count': True}, "auto_leave_count has the wrong type"),
+    ({'email': "", 'password': "", 'run_at_time': "6am"}, "run_at_time is not in HH:MM format"),
+    ({'email': "", 'password': "", 'chrome_type': "firefox"}, "chrome_type is not"),
+    ({'email': "", 'password': "", 'driver_path': "/does/not/exist"}, "driver_path file does not exist"),
+    ({'password': ""}, "email is missing"),
+])
+def test_invalid_config(check, capsys, text, message):
+    assert not check(text)
+    assert message in capsys.readouterr().out
+
+
+def test_missing_config(joiner, tmp_path, capsys):
+    assert not joiner.check_config(str(tmp_path / "missing.json"))
+    assert "could not be read" in capsys.readouterr().out
@@ -0,0 +1,106 @@
+import subprocess
+import sys
+import time
+from threading import Event, Lock, Thread
+from types import SimpleNamespace
+
+import pytest
+
+
+class FakeDriver:
+    # Records how many commands run at once. Commands named "hang" block until released
+    def __init__(self):
+        self.running = 0
+        self.most_running = 0
+        self.lock = Lock()
+        self.release = Event()
+        self.commands = []
+        self.quit_called = False
+
+    def execute(self, driver_command, params=None):
+        with self.lock:
+            self.running += 1
+            self.most_running = max(self.most_running, self.running)
+        if driver_command == "hang":
+            self.release.wait(10)
+        else:
+            time.sleep(0.001)
+        with self.lock:
+            self.running -= 1
+            self.commands.append(driver_command)
+        return {'value': params}
+
+    def execute_script(self, script):
+        return self.execute("script", script)['value'] and 1
+
+    def quit(self):
+        self.quit_called = True
+
+
+@pytest.fixture
+def driver(joiner, monkeypatch):
+    fake = FakeDriver()
+    monkeypatch.setattr(joiner, "browser", fake)
+    joiner.serialize_browser()
+    yield fake
+    fake.release.set()
+    fake.driver_thread.close()
+
+
+def test_commands_from_threads_do_not_overlap(driver):
+    threads = [Thread(target=lambda: [driver.execute("command", i) for i in range(20)]) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(driver.commands) == 80
+    assert driver.most_running == 1
+
+
+def test_nested_calls_run_on_the_worker(driver):
+    # execute_script calls execute, which is already on the driver thread
+    assert driver.driver_thread.run(driver.execute_script, "return 1", timeout=1) == 1
+
+
+def test_hung_browser_fails_the_check(joiner, driver):
+    joiner.check_browser(timeout=1)
+
+    Thread(target=driver.execute, args=("hang",), daemon=True).start()
+    start = time.time()
+    with pytest.raises(joiner.SessionError):
+        joiner.check_browser(timeout=0.5)
+    assert time.time() - start < 2
+
+    # The ping waited for the hung command instead of running next to it
+    driver.release.set()
+    joiner.check_browser(timeout=1)
+    assert driver.most_running == 1
+
+
+def test_quit_browser(joiner, driver):
+    joiner.quit_browser()
+    assert driver.quit_called
+    assert joiner.browser is None
+    joiner.quit_browser()
+
+
+def test_hung_browser_is_killed_on_quit(joiner, driver, monkeypatch, capsys):
+    monkeypatch.setattr(joiner, "QUIT_TIMEOUT", 0.2)
+    killed = []
+    monkeypatch.setattr(joiner, "kill_browser_processes", lambda: killed.append(True))
+    Thread(target=driver.execute, args=("hang",), daemon=True).start()
+
+    start = time.time()
+    joiner.quit_browser()
+    assert time.time() - start < 2
+    assert killed
+    assert joiner.browser is None
+    assert "killing it" in capsys.readouterr().out
+
+
+def test_kill_browser_processes(joiner, driver):
+    # A process that would run for a minute stands in for the driver
+    process = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(60)"])
+    driver.service = SimpleNamespace(process=process)
+    joiner.kill_browser_processes()
+    assert process.poll() is not None
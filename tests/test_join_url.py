@@ -0,0 +1,61 @@
+import time
+
+import pytest
+
+LINK = "https://teams.microsoft.com/l/meetup-join/19%3ameeting_abc%40thread.v2/0?context=%7b%7d"
+JOIN_PAGE = "https://teams.microsoft.com/_#/l/meetup-join/19%3ameeting_abc%40thread.v2/0?context=%7b%7d"
+
+
+@pytest.mark.parametrize("url, expected", [
+    (LINK, JOIN_PAGE),
+    # Links that already open the join page, or have no /l/ path, are opened as they are
+    (JOIN_PAGE, JOIN_PAGE),
+    ("https://teams.live.com/meet/9876543210", "https://teams.live.com/meet/9876543210"),
+    ("", ""),
+])
+def test_get_join_url(joiner, url, expected):
+    assert joiner.get_join_url(url) == expected
+
+
+def test_resolve_join_url_without_browser(joiner):
+    # Links from a calendar source and cached links are used without opening the calendar
+    assert joiner.resolve_join_url(joiner.Meeting("a", 0, "Maths", url=LINK)) == JOIN_PAGE
+    joiner.join_urls['b'] = JOIN_PAGE
+    assert joiner.resolve_join_url(joiner.Meeting("b", 0, "English")) == JOIN_PAGE
+
+
+def test_prefetch_join_urls(joiner, monkeypatch):
+    now = time.time()
+    resolved = []
+    monkeypatch.setattr(joiner, "resolve_join_url", lambda meeting: resolved.append(meeting.m_id) or JOIN_PAGE)
+    monkeypatch.setattr(joiner, "switch_to_calendar_tab", lambda: resolved.append("calendar"))
+    for m_id, start, title, url in [("soon", now + 60, "Maths", None), ("later", now + 3600, "English", None),
+                                    ("linked", now + 60, "Art", LINK), ("cached", now + 60, "Music", None),
+                                    ("joined", now + 60, "Drama", None)]:
+        joiner.calendar_index[m_id] = joiner.Meeting(m_id, start, title, start + 600, url)
+        joiner.join_deadlines.append((start, m_id))
+    joiner.join_urls['cached'] = JOIN_PAGE
+    joiner.already_joined_ids.add("joined")
+
+    joiner.prefetch_join_urls(300)
+    assert resolved == ["soon", "calendar"]
+
+
+def test_prefetch_looks_up_one_link_per_call(joiner, monkeypatch):
+    now = time.time()
+    resolved = []
+
+    def resolve(meeting):
+        resolved.append(meeting.m_id)
+        joiner.join_urls[meeting.m_id] = JOIN_PAGE
+        return JOIN_PAGE
+
+    monkeypatch.setattr(joiner, "resolve_join_url", resolve)
+    monkeypatch.setattr(joiner, "switch_to_calendar_tab", lambda: None)
+    for m_id, start in [("second", now + 120), ("first", now + 60), ("third", now + 180)]:
+        joiner.calendar_index[m_id] = joiner.Meeting(m_id, start, m_id, start + 600)
+        joiner.join_deadlines.append((start, m_id))
+
+    for _ in range(4):
+        joiner.prefetch_join_urls(300)
+    assert resolved == ["first", "second", "third"]
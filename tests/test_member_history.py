@@ -0,0 +1,66 @@
+import pytest
+
+from auto_joiner import MemberHistory
+
+# Member counts read every check interval in recorded meetings.
+# 0 is a failed read of the participant list
+CLASS_ENDS = [3, 12, 24, 26, 26, 25, 26, 26, 25, 19, 11, 6, 4, 2]
+ROSTER_GLITCH = [22, 23, 23, 5, 23, 23, 0, 0, 22, 23, 22, 21]
+TRICKLE_OUT = [30, 30, 29, 27, 25, 22, 20, 18, 16, 14, 13, 12, 10]
+SMALL_GROUP = [4, 5, 5, 5, 4, 5, 3, 2]
+
+
+def leave_index(history, trace):
+    # Index of the count at which the meeting would be left, or None
+    for i, count in enumerate(trace):
+        if history.add(count):
+            return i
+    return None
+
+
+@pytest.mark.parametrize("history, trace, expected", [
+    # A single count at the limit leaves, even during a glitch
+    (MemberHistory(7), CLASS_ENDS, 0),
+    (MemberHistory(7), ROSTER_GLITCH, 3),
+    # Several counts in a row ride out the glitch and the joining phase
+    (MemberHistory(7, samples=2), ROSTER_GLITCH, None),
+    (MemberHistory(7, samples=2), CLASS_ENDS[2:], 10),
+    # Leave at a share of the largest count
+    (MemberHistory(2, peak_percent=50), CLASS_ENDS, 10),
+    (MemberHistory(2, samples=2, peak_percent=50), CLASS_ENDS, 11),
+    (MemberHistory(2, samples=2, peak_percent=50), TRICKLE_OUT, 10),
+    # Leave when many people leave within the window
+    (MemberHistory(2, drop_count=10, window=3), CLASS_ENDS, 10),
+    (MemberHistory(2, drop_count=10, window=3), TRICKLE_OUT, None),
+    (MemberHistory(2, drop_count=10, window=10), TRICKLE_OUT, 6),
+    # Small meetings are only left below the fixed count
+    (MemberHistory(2, samples=2, peak_percent=10), SMALL_GROUP, None),
+])
+def test_recorded_traces(history, trace, expected):
+    assert leave_index(history, trace) == expected
+
+
+def test_failed_reads_are_ignored():
+    history = MemberHistory(7, samples=2)
+    assert not history.add(5)
+    assert not history.add(0)
+    assert not history.add(None)
+    assert history.add(4)
+
+
+def test_counts_above_the_limit_reset_the_samples():
+    history = MemberHistory(7, samples=3)
+    assert leave_index(history, [6, 6, 8, 6, 6]) is None
+    assert history.add(6)
+
+
+def test_new_member_history(joiner):
+    history = joiner.new_member_history({'auto_leave_count': 5, 'auto_leave_samples': 3,
+                                         'auto_leave_peak_percent': 40, 'auto_leave_drop_count': 8,
+                                         'auto_leave_drop_window': 6})
+    assert (history.leave_count, history.samples, history.peak_percent, history.drop_count) == (5, 3, 40, 8)
+    assert history.counts.maxlen == 6
+
+    # Values out of range keep the defaults
+    history = joiner.new_member_history({'auto_leave_count': 1, 'auto_leave_samples': 0})
+    assert (history.leave_count, history.samples, history.peak_percent, history.drop_count) == (7, 1, 0, 0)
@@ -0,0 +1,76 @@
+import json
+
+import pytest
+
+
+@pytest.fixture
+def metrics(joiner, monkeypatch):
+    monkeypatch.setattr(joiner, "metrics", {})
+    monkeypatch.setattr(joiner, "metrics_file", None)
+    return joiner.metrics
+
+
+def test_record_timing(joiner, metrics):
+    joiner.record_timing("scan", 0.03)
+    joiner.record_timing("scan", 1.5, timed_out=True)
+    joiner.record_timing("scan", 100)
+
+    metric = metrics["scan"]
+    assert metric['count'] == 3
+    assert metric['total'] == pytest.approx(101.53)
+    assert metric['max'] == 100
+    assert metric['timeouts'] == 1
+    # Every bucket counts the calls that took at most its bound
+    assert dict(zip(joiner.METRIC_BUCKETS, metric['buckets'])) == {
+        0.01: 0, 0.05: 1, 0.1: 1, 0.5: 1, 1: 1, 2: 2, 5: 2, 10: 2, 30: 2, 60: 2}
+
+
+def test_record_timing_to_file(joiner, metrics, tmp_path, monkeypatch):
+    path = tmp_path / "metrics.jsonl"
+    monkeypatch.setattr(joiner, "config", {'metrics_file': str(path)})
+    joiner.start_metrics()
+    joiner.record_timing("join", 2.34567, timed_out=True)
+    joiner.close_metrics()
+
+    line = json.loads(path.read_text())
+    assert (line['name'], line['duration'], line['timed_out']) == ("join", 2.3457, True)
+
+
+def test_format_metrics(joiner, metrics):
+    joiner.record_timing("wait_until_found button[data-tid='call-hangup']", 0.2)
+    joiner.record_timing('say "hi"', 0.001, timed_out=True)
+
+    lines = joiner.format_metrics().splitlines()
+    assert lines[0] == "# TYPE auto_joiner_duration_seconds histogram"
+    assert 'auto_joiner_duration_seconds_bucket{name="say \\"hi\\"",le="0.01"} 1' in lines
+    assert ('auto_joiner_duration_seconds_bucket{name="wait_until_found button[data-tid=\'call-hangup\']",'
+            'le="0.1"} 0') in lines
+    assert ('auto_joiner_duration_seconds_bucket{name="wait_until_found button[data-tid=\'call-hangup\']",'
+            'le="+Inf"} 1') in lines
+    assert 'auto_joiner_duration_seconds_count{name="say \\"hi\\""} 1' in lines
+    assert "# TYPE auto_joiner_timeouts_total counter" in lines
+    assert 'auto_joiner_timeouts_total{name="say \\"hi\\""} 1' in lines
+    assert len([x for x in lines if x.startswith("auto_joiner_duration_seconds_bucket")]) == \
+        2 * (len(joiner.METRIC_BUCKETS) + 1)
+
+
+class FakeElement:
+    def is_displayed(self):
+        return True
+
+
+class FakeBrowser:
+    def find_element(self, by, value):
+        return FakeElement()
+
+    def find_element_by_css_selector(self, value):
+        return FakeElement()
+
+
+def test_dynamic_selectors_share_a_metric(joiner, metrics, monkeypatch):
+    monkeypatch.setattr(joiner, "browser", FakeBrowser())
+    for m_id in ["AAMkADdh-1", "AAMkADdh-2"]:
+        assert joiner.wait_until_found(f"div[id='{m_id}']", 1, name="event card") is not None
+    joiner.wait_until_found("#teams-app-bar", 1)
+    assert sorted(metrics) == ["wait_until_found #teams-app-bar", "wait_until_found event card"]
+    assert metrics["wait_until_found event card"]['count'] == 2
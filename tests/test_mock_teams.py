@@ -0,0 +1,241 @@
+import json
+import os
+import shutil
+import time
+import urllib.request
+from datetime import date, datetime
+
+import pytest
+
+import auto_joiner
+from tests.mock_teams import MockTeams
+
+# Benchmarks the calendar scan, joining and member count probe against the mock Teams page in headless Chrome.
+# Set AUTO_JOINER_DRIVER to the chromedriver to use if it is not on the PATH
+DRIVER_PATH = os.environ.get("AUTO_JOINER_DRIVER") or shutil.which("chromedriver")
+needs_browser = pytest.mark.skipif(DRIVER_PATH is None, reason="chromedriver is not installed")
+
+CARD_COUNTS = [1, 10, 50, 100, 200]
+
+# Most seconds the calendar scan, joining and the member count may take on average for each calendar size.
+# Set AUTO_JOINER_BUDGET_SCALE to allow more time on a slow machine, for example 2 for twice the time
+BUDGET_SCALE = float(os.environ.get("AUTO_JOINER_BUDGET_SCALE") or 1)
+BUDGETS = {1: (0.5, 8, 2), 10: (0.5, 8, 2), 50: (1, 8, 2), 100: (1.5, 8, 2), 200: (2.5, 8, 2)}
+
+
+@pytest.fixture(scope="module")
+def mock_teams():
+    mock = MockTeams()
+    yield mock
+    mock.close()
+
+
+def browser_config(mock_teams, joined_file):
+    return {'email': "", 'password': "", 'headless': True, 'mute_audio': True, 'driver_path': DRIVER_PATH,
+            'teams_url': mock_teams.url, 'joined_file': str(joined_file), 'join_sound': ""}
+
+
+@pytest.fixture(scope="module")
+def session(mock_teams, tmp_path_factory):
+    # One browser for all the benchmarks, started and logged in the way the bot does it
+    mock_teams.set_meetings(1)
+    auto_joiner.config = browser_config(mock_teams, tmp_path_factory.mktemp("session") / "joined.txt")
+    auto_joiner.start_session()
+    yield auto_joiner.browser
+    auto_joiner.quit_browser()
+    auto_joiner.config = None
+
+
+def print_table(request, lines):
+    # Prints benchmark results, also when pytest captures the output
+    with request.config.pluginmanager.getplugin("capturemanager").global_and_fixture_disabled():
+        print("\n" + "\n".join(lines))
+
+
+@pytest.fixture(scope="module")
+def report(request):
+    # Prints the timings of every calendar size and their budgets after the benchmarks
+    results = []
+    yield results
+    if len(results) == 0:
+        return
+    lines = [f"{'cards':>6} {'scan':>9} {'join':>9} {'members':>9}   budget"]
+    for count, times in results:
+        budget = " / ".join(f"{x * BUDGET_SCALE:g}s" for x in BUDGETS[count])
+        lines.append(f"{count:>6} " + " ".join(f"{x:>8.3f}s" for x in times) + f"   {budget}")
+    print_table(request, lines)
+
+
+def page_script(browser, script):
+    # Runs a script without recording it in the metrics
+    return type(browser).execute_script(browser, script)
+
+
+def average(name):
+    metric = auto_joiner.metrics[name]
+    return metric['total'] / metric['count']
+
+
+def read_cards_per_element(browser):
+    # The calendar scan before CALENDAR_CARDS_SCRIPT, with a round-trip for every card and attribute
+    cards = []
+    for card in browser.find_elements_by_css_selector("div[class*='multi-day-renderer__eventCard']"):
+        inner = card.find_element_by_css_selector("div")
+        cards.append({'style': card.get_attribute("style"), 'title': inner.get_attribute("title"),
+                      'id': inner.get_attribute("id")})
+    return cards
+
+
+@pytest.fixture(scope="module")
+def scan_report(request):
+    # Prints the round-trips and time of both ways to read the cards after the benchmarks
+    results = []
+    yield results
+    if len(results) == 0:
+        return
+    lines = [f"{'cards':>6} {'per element':>20} {'batch script':>20}"]
+    for count, (slow_calls, slow_time), (fast_calls, fast_time) in results:
+        lines.append(f"{count:>6} {slow_calls:>7} calls {slow_time:>6.3f}s {fast_calls:>7} calls {fast_time:>6.3f}s")
+    print_table(request, lines)
+
+
+def test_mock_page_serves_meetings(mock_teams):
+    mock_teams.set_meetings(3, members=4)
+    with urllib.request.urlopen(mock_teams.url + "_#/l/meetup-join/mock-meeting-0") as response:
+        page = response.read().decode("utf-8")
+    data = json.loads(page[page.index("var MOCK_DATA = ") + 16:page.index(";\n", page.index("var MOCK_DATA"))])
+    assert [x['id'] for x in data['meetings']] == ["mock-meeting-0", "mock-meeting-1", "mock-meeting-2"]
+    assert data['members'] == 4
+
+
+@needs_browser
+@pytest.mark.parametrize("count", CARD_COUNTS)
+def test_calendar_join_and_members(joiner, session, mock_teams, report, monkeypatch, tmp_path, count):
+    members = count % 20 + 3
+    mock_teams.set_meetings(count, members)
+    joiner.config = browser_config(mock_teams, tmp_path / "joined.txt")
+    monkeypatch.setattr(joiner, "metrics", {})
+    session.get(mock_teams.url)
+    joiner.prepare_calendar_page()
+
+    # Every card is read with the right times
+    joiner.install_watcher()
+    assert joiner.get_calendar_meetings()
+    assert sorted(joiner.calendar_index) == sorted(x['id'] for x in mock_teams.meetings)
+    midnight = int(datetime.combine(date.today(), datetime.min.time()).timestamp())
+    last = joiner.calendar_index[f"mock-meeting-{count - 1}"]
+    start = midnight + (count - 1) * 7 * 60
+    assert (last.time_started, last.time_ended) == (start, start + 30 * 60)
+    assert last.title == f"Mock meeting {count - 1}"
+
+    # The scan's own changes to the page are not reported, a new card is
+    assert not joiner.wait_for_page_change(1.5)
+    page_script(session, "setTimeout(function () { mockTeams.addMeeting("
+                         "{id: 'added', title: 'Added', start: 1400, duration: 30}); }, 300);")
+    assert joiner.wait_for_page_change(5, ("card",))
+    assert joiner.get_calendar_meetings()
+    assert "added" in joiner.calendar_index
+
+    # Join through the card's meeting link, with camera and microphone off
+    meeting = joiner.calendar_index["mock-meeting-0"]
+    joiner.join_meeting(meeting)
+    assert joiner.current_meeting is meeting
+    assert "mock-meeting-0" in joiner.already_joined_ids
+    assert page_script(session, "return mockTeams.inCall();")
+    assert page_script(session, "return mockTeams.joinedWith();") == ["false", "false"]
+
+    # The first probe opens the roster, later probes read it directly
+    assert joiner.get_meeting_members() == members
+    page_script(session, "mockTeams.setMembers(2);")
+    assert joiner.get_meeting_members() == 2
+    assert joiner.new_member_history().add(2)
+
+    assert joiner.hangup()
+    assert joiner.current_meeting is None
+    assert not page_script(session, "return mockTeams.inCall();")
+
+    # Every step stays within the budget of this calendar size
+    times = (average("get_calendar_meetings"), average("join"), average("get_meeting_members"))
+    report.append((count, times))
+    for step, took, budget in zip(("scan", "join", "members"), times, BUDGETS[count]):
+        assert took <= budget * BUDGET_SCALE, f"{step} of {count} cards took {took:.3f}s, budget {budget}s"
+
+
+@needs_browser
+@pytest.mark.parametrize("count", CARD_COUNTS)
+def test_card_scan_round_trips(joiner, session, mock_teams, scan_report, monkeypatch, count):
+    mock_teams.set_meetings(count)
+    session.get(mock_teams.url)
+
+    # Count the commands sent to the driver, elements send theirs through the browser too
+    calls = []
+    execute = session.execute
+    monkeypatch.setattr(session, "execute",
+                        lambda command, params=None: calls.append(command) or execute(command, params))
+
+    def measure(read_cards):
+        calls.clear()
+        start = time.perf_counter()
+        cards = read_cards()
+        return cards, (len(calls), time.perf_counter() - start)
+
+    slow_cards, slow = measure(lambda: read_cards_per_element(session))
+    fast_cards, fast = measure(lambda: page_script(session, joiner.CALENDAR_CARDS_SCRIPT))
+
+    # Both read the same cards, the script in a single round-trip
+    assert fast_cards == slow_cards
+    assert len(fast_cards) == count
+    assert slow[0] == 1 + 4 * count
+    assert fast[0] == 1
+    if count >= 50:
+        assert fast[1] < slow[1]
+    scan_report.append((count, slow, fast))
+
+
+@needs_browser
+def test_low_resource_join_turns_off_incoming_video(joiner, session, mock_teams, tmp_path):
+    mock_teams.set_meetings(1)
+    joiner.config = {**browser_config(mock_teams, tmp_path / "joined.txt"), 'low_resource': True}
+    session.get(mock_teams.url)
+    joiner.prepare_calendar_page()
+    assert joiner.get_calendar_meetings()
+
+    joiner.join_meeting(joiner.calendar_index["mock-meeting-0"])
+    assert page_script(session, "return mockTeams.inCall();")
+    assert not page_script(session, "return mockTeams.incomingVideo();")
+    assert page_script(session, "return document.getElementById('call-more-menu');") is None
+    assert joiner.hangup()
+
+
+# Kept last, since it replaces the browser of the session
+@needs_browser
+@pytest.mark.parametrize("target", ["driver", "browser"])
+def test_recovery_rejoins_meeting(joiner, session, mock_teams, tmp_path, target):
+    mock_teams.set_meetings(1)
+    joiner.config = browser_config(mock_teams, tmp_path / "joined.txt")
+    joiner.browser.get(mock_teams.url)
+    joiner.prepare_calendar_page()
+    assert joiner.get_calendar_meetings()
+    meeting = joiner.calendar_index["mock-meeting-0"]
+    joiner.join_meeting(meeting)
+    assert joiner.current_meeting is meeting
+
+    # Kill chromedriver, or the browser processes it started
+    driver_process = joiner.browser.service.process
+    if target == "driver":
+        driver_process.kill()
+    else:
+        psutil = pytest.importorskip("psutil")
+        for process in psutil.Process(driver_process.pid).children(recursive=True):
+            process.kill()
+    with pytest.raises(joiner.SessionError):
+        joiner.check_browser(timeout=10)
+
+    start = time.time()
+    joiner.recover_session("killed the " + target)
+    assert time.time() - start < 60
+    assert joiner.browser.service.process.pid != driver_process.pid
+    assert driver_process.poll() is not None
+    assert joiner.current_meeting is not None and joiner.current_meeting.m_id == "mock-meeting-0"
+    assert page_script(joiner.browser, "return mockTeams.inCall();")
+    assert joiner.hangup()
@@ -0,0 +1,64 @@
+import pytest
+
+
+class FakeBrowser:
+    # Reports the given page metrics through the DevTools protocol
+    def __init__(self):
+        self.metrics = {'JSHeapUsedSize': 50 * 1024 * 1024, 'Nodes': 1200, 'TaskDuration': 10}
+
+    def execute_cdp_cmd(self, cmd, params):
+        if cmd == 'Performance.getMetrics':
+            return {'metrics': [{'name': name, 'value': value} for name, value in self.metrics.items()]}
+        return {}
+
+
+@pytest.fixture
+def usage(joiner, monkeypatch):
+    # Lets the tests set the time and the usage of the browser processes
+    class Usage:
+        now = 1000
+        processes = (5, 300 * 1024 * 1024, 20.0)
+
+    fake = Usage()
+    monkeypatch.setattr(joiner, "browser", FakeBrowser())
+    monkeypatch.setattr(joiner, "last_resource_usage", None)
+    monkeypatch.setattr(joiner, "get_process_usage", lambda: fake.processes)
+    monkeypatch.setattr(joiner.time, "time", lambda: fake.now)
+    return fake
+
+
+def test_resource_usage(joiner, usage, capsys):
+    joiner.print_resource_usage()
+    out = capsys.readouterr().out
+    assert "Browser processes: 300 MB in 5 processes\n" in out
+    assert "Page: 50 MB JS heap, 1200 DOM nodes\n" in out
+    assert "CPU" not in out and "main thread" not in out
+
+    usage.now += 100
+    usage.processes = (6, 400 * 1024 * 1024, 70.0)
+    joiner.browser.metrics['TaskDuration'] = 30
+    joiner.print_resource_usage()
+    out = capsys.readouterr().out
+    assert "Browser processes: 400 MB in 6 processes, CPU: 50.0% of a core" in out
+    assert "main thread: 20.0% of a core" in out
+
+
+def test_resource_usage_without_psutil(joiner, usage, capsys):
+    usage.processes = None
+    joiner.print_resource_usage()
+    usage.now += 10
+    joiner.print_resource_usage()
+    out = capsys.readouterr().out
+    assert "Browser processes" not in out
+    assert "main thread: 0.0% of a core" in out
+
+
+def test_restarted_browser_counts_from_zero(joiner, usage, capsys):
+    # A new browser starts its CPU times at zero again, which must not give a negative use
+    joiner.print_resource_usage()
+    usage.now += 60
+    usage.processes = (5, 300 * 1024 * 1024, 1.0)
+    joiner.browser.metrics['TaskDuration'] = 0.5
+    joiner.print_resource_usage()
+    out = capsys.readouterr().out
+    assert "-" not in out
@@ -0,0 +1,64 @@
+import pytest
+
+
+class FakeProcess:
+    # A worker process that exits with exit_code once its run time has passed
+    def __init__(self, clock, run_time, exit_code):
+        self.clock = clock
+        self.end = clock.now + run_time
+        self.exit_code = exit_code
+
+    def is_alive(self):
+        return self.clock.now < self.end
+
+    @property
+    def exitcode(self):
+        return None if self.is_alive() else self.exit_code
+
+    def terminate(self):
+        self.end = self.clock.now
+
+
+@pytest.fixture
+def accounts(joiner, monkeypatch):
+    # Runs the accounts on a fake clock. runs[path] lists the (run time, exit code) of each start
+    class Accounts:
+        now = 0
+        runs = {}
+        starts = []
+
+    fake = Accounts()
+
+    def start_account(path, wait_for_start=True):
+        fake.starts.append((fake.now, path))
+        run_time, exit_code = fake.runs[path].pop(0)
+        return FakeProcess(fake, run_time, exit_code)
+
+    def sleep(seconds):
+        fake.now += seconds
+
+    monkeypatch.setattr(joiner, "start_account", start_account)
+    monkeypatch.setattr(joiner.time, "sleep", sleep)
+    monkeypatch.setattr(joiner.time, "time", lambda: fake.now)
+    return fake
+
+
+def test_crashing_account_backs_off_and_gives_up(joiner, accounts, capsys):
+    accounts.runs = {'bad.json': [(0, 1)] * 5, 'good.json': [(100, 0)]}
+    joiner.run_accounts(['bad.json', 'good.json'], restart_limit=5, first_delay=5, max_delay=20)
+
+    # Restarted after 5, 10, 20 and 20 seconds, then given up
+    assert [time for time, path in accounts.starts if path == 'bad.json'] == [0, 6, 17, 38, 59]
+    out = capsys.readouterr().out
+    assert "[bad] Crashed with exit code 1, restarting in 5s..." in out
+    assert "[bad] Crashed 5 times in a row (exit code 1), giving up." in out
+    assert "[good] Stopped." in out
+    assert accounts.runs['bad.json'] == []
+
+
+def test_long_runs_reset_the_backoff(joiner, accounts, capsys):
+    # Crashes after a stable run are restarted quickly again
+    accounts.runs = {'a.json': [(1000, 1), (1000, 1), (1000, 1), (0, 0)]}
+    joiner.run_accounts(['a.json'], restart_limit=2, first_delay=5, stable_time=600)
+    assert [time for time, path in accounts.starts] == [0, 1005, 2010, 3015]
+    assert "giving up" not in capsys.readouterr().out
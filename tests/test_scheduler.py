@@ -0,0 +1,106 @@
+import heapq
+
+import pytest
+
+NOW = 1_600_000_000
+
+
+@pytest.fixture
+def clock(joiner, monkeypatch):
+    # Fake clock, tests move it by changing clock.now
+    class Clock:
+        now = NOW
+
+    fake = Clock()
+    monkeypatch.setattr(joiner.time, "time", lambda: fake.now)
+    return fake
+
+
+def set_deadlines(joiner, *deadlines):
+    joiner.join_deadlines = [(deadline, f"meeting{i}") for i, deadline in enumerate(deadlines)]
+    heapq.heapify(joiner.join_deadlines)
+
+
+def test_no_deadlines_waits_the_full_interval(joiner, clock):
+    assert joiner.time_until_next_deadline(60) == 60
+
+
+def scan(joiner, clock):
+    # What get_calendar_meetings() records about a scan
+    joiner.last_scan_time = clock.now
+
+
+def test_waits_until_the_next_join(joiner, clock):
+    scan(joiner, clock)
+    set_deadlines(joiner, NOW + 45, NOW + 20, NOW + 300)
+    assert joiner.time_until_next_deadline(60) == 20
+
+    # The scan at the join time handles that meeting, so the next wait is for the one after it
+    clock.now += 20
+    scan(joiner, clock)
+    assert joiner.time_until_next_deadline(60) == 25
+
+
+def test_deadlines_handled_by_the_scan_are_skipped(joiner, clock):
+    set_deadlines(joiner, NOW - 30, NOW - 5, NOW + 40)
+    scan(joiner, clock)
+    assert joiner.time_until_next_deadline(60) == 40
+    assert joiner.join_deadlines == [(NOW + 40, "meeting2")]
+
+    # Without a deadline left the loop must not spin
+    clock.now += 41
+    scan(joiner, clock)
+    assert joiner.time_until_next_deadline(60) == 60
+
+
+def test_deadline_passed_since_the_scan_is_due(joiner, clock):
+    # Joining or finding meeting links took longer than the time until the next join
+    scan(joiner, clock)
+    set_deadlines(joiner, NOW + 5, NOW + 600)
+    clock.now += 8
+    assert joiner.time_until_next_deadline(60) == 0
+
+    # The next scan handles it
+    scan(joiner, clock)
+    assert joiner.time_until_next_deadline(60) == 60
+
+
+def test_scan_records_its_time(joiner, clock, monkeypatch):
+    monkeypatch.setattr(joiner, "metrics", {})
+    monkeypatch.setattr(joiner, "read_meetings", lambda: {'a': (NOW + 120, NOW + 900, "Maths", None)})
+    clock.now += 30
+    assert joiner.get_calendar_meetings()
+    assert joiner.last_scan_time == NOW + 30
+    assert joiner.time_until_next_deadline(300) == 90
+
+    # A failed read also counts as a scan, so it is not retried without a pause
+    monkeypatch.setattr(joiner, "read_meetings", lambda: None)
+    clock.now += 100
+    assert not joiner.get_calendar_meetings()
+    assert joiner.time_until_next_deadline(300) == 300
+
+
+def test_join_deadlines_are_ignored_in_a_meeting(joiner, clock):
+    joiner.current_meeting = joiner.Meeting("current", NOW - 600, "Maths", NOW + 600)
+    set_deadlines(joiner, NOW + 10)
+    assert joiner.time_until_next_deadline(60) == 60
+
+    joiner.leave_at = NOW + 30
+    assert joiner.time_until_next_deadline(60) == 30
+
+
+def test_passed_leave_time_is_ignored(joiner, clock):
+    joiner.current_meeting = joiner.Meeting("current", NOW - 600, "Maths", NOW + 600)
+    joiner.leave_at = NOW - 1
+    assert joiner.time_until_next_deadline(60) == 60
+
+
+def test_join_time(joiner):
+    joiner.join_early_offset = 120
+    assert joiner.get_join_time("a", NOW) == NOW - 120
+
+    # The random delay is chosen once per meeting
+    joiner.config['random_delay'] = True
+    join_time = joiner.get_join_time("a", NOW)
+    assert NOW - 120 + 10 <= join_time <= NOW - 120 + 30
+    assert joiner.get_join_time("a", NOW) == join_time
@@ -0,0 +1,172 @@
+import json
+import random
+
+import pytest
+
+from auto_joiner import choose_meeting
+
+START = 1_615_194_000  # 2021-03-08, a Monday
+
+
+@pytest.fixture
+def write_log(tmp_path):
+    # Writes event log lines to a file and returns its path
+    def write(events):
+        path = tmp_path / "events.log"
+        path.write_text("".join(json.dumps(event) + "\n" for event in events))
+        return str(path)
+    return write
+
+
+def card(t, m_id, start, minutes=50, title=None):
+    return {'t': t, 'event': "card", 'id': m_id, 'title': title or m_id, 'start': start, 'end': start + minutes * 60}
+
+
+def members(m_id, start, counts, interval=10):
+    return [{'t': start + i * interval, 'event': "members", 'id': m_id, 'count': count}
+            for i, count in enumerate(counts)]
+
+
+def test_load_event_log(joiner, write_log):
+    day = 86400
+    log = joiner.load_event_log(write_log([
+        card(START - 600, "maths", START),
+        card(START - 300, "maths", START + 60),  # moved, the last card wins
+        card(START + day - 600, "maths", START + day),
+        *members("maths", START, [5, 5, 6, 6, 6, 2]),
+        {'t': START, 'event': "join", 'id': "maths", 'latency': 3},
+        {'t': START + day, 'event': "join", 'id': "maths", 'latency': 9},
+        {'t': START + day, 'event': "join", 'id': "maths", 'latency': 4},
+    ]))
+    first, second = sorted(log['meetings'], key=lambda x: x.time_started)
+    assert first.m_id != second.m_id
+    assert (first.time_started, second.time_started) == (START + 60, START + day)
+    assert log['seen'][first.m_id] == START - 600
+
+    # Only changes of the member count are kept
+    assert log['members'][first.m_id] == [(START, 5), (START + 20, 6), (START + 50, 2)]
+    assert log['member_times'][first.m_id] == [START, START + 20, START + 50]
+    assert second.m_id not in log['members']
+    assert log['latency'] == 4
+
+
+def reference_simulate(log, settings):
+    # The bot's loop checked on every check_interval, without skipping ahead
+    check_interval = settings['check_interval']
+    offset = settings['join_early_offset']
+    result = {'joined': 0, 'late': 0, 'lateness': 0}
+    now = min(log['seen'].values())
+    last_end = max(x.time_ended for x in log['meetings'])
+    handled = set()
+    while now < last_end:
+        seen = [x for x in log['meetings'] if log['seen'][x.m_id] <= now]
+        meeting = choose_meeting([x for x in seen if x.time_started - offset <= now < x.time_ended], handled)
+        if meeting is None:
+            deadlines = [x.time_started - offset for x in seen
+                         if x.m_id not in handled and x.time_started - offset > now]
+            now = min([now + check_interval] + deadlines)
+            continue
+        handled.add(meeting.m_id)
+        joined_at = now + log['latency']
+        if joined_at >= meeting.time_ended:
+            continue
+        result['joined'] += 1
+        if joined_at > meeting.time_started:
+            result['late'] += 1
+            result['lateness'] += joined_at - meeting.time_started
+        now = meeting.time_ended
+    return result
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_simulate_matches_checking_every_interval(joiner, write_log, seed):
+    generator = random.Random(seed)
+    events = []
+    for i in range(12):
+        start = START + i * 1800 + generator.choice([0, 300, 900])
+        # Some cards only appear after the meeting started
+        events.append(card(start - generator.choice([3600, 600, -120, -400]), f"m{i}", start,
+                           minutes=generator.choice([10, 20, 50])))
+    events.append({'t': START, 'event': "join", 'id': "m0", 'latency': generator.choice([2, 5, 30])})
+    log = joiner.load_event_log(write_log(events))
+
+    for check_interval in [5, 20, 45]:
+        for offset in [0, 60]:
+            settings = {'check_interval': check_interval, 'join_early_offset': offset}
+            result = joiner.simulate(log, settings)
+            expected = reference_simulate(log, settings)
+            assert {key: result[key] for key in expected} == expected
+            assert result['missed'] == len(log['meetings']) - result['joined']
+
+
+def test_simulate_joins_and_misses(joiner, write_log):
+    joiner.blacklist_meeting_patterns = [joiner.re.compile("Free")]
+    log = joiner.load_event_log(write_log([
+        card(START - 3600, "early", START),
+        card(START + 3000 + 125, "late card", START + 3000),
+        card(START - 3600, "Free period", START + 6000),
+        {'t': START, 'event': "join", 'id': "early", 'latency': 5},
+    ]))
+    result = joiner.simulate(log, {'check_interval': 20, 'join_early_offset': 60})
+    # The late card is found by the first check after it appears, at START + 3000 + 140
+    assert result == {'joined': 2, 'missed': 0, 'late': 1, 'lateness': 145, 'premature_leaves': 0}
+
+    result = joiner.simulate(log, {'check_interval': 20, 'join_early_offset': 60, 'auto_leave_after_min': 55})
+    assert result['joined'] == 2
+
+    # Slower checks can find the late card too late to join
+    log['meetings'][1].time_ended = START + 3000 + 150
+    assert joiner.simulate(log, {'check_interval': 60, 'join_early_offset': 60})['missed'] == 1
+
+
+# A class where the roster drops to half and then fills up again, and ends with everyone leaving
+BREAK_AND_END = [3, 20, 30, 30, 30, 14, 13, 29, 30, 30, 30, 12, 6, 2]
+
+
+@pytest.mark.parametrize("settings, leave_index, premature", [
+    # Leaves on the first count, while people are still joining
+    ({'auto_leave_count': 7}, 0, True),
+    # Two counts in a row wait for the end of the meeting
+    ({'auto_leave_count': 7, 'auto_leave_samples': 2}, 13, False),
+    # Leaves at half the peak during the break, people came back
+    ({'auto_leave_count': 2, 'auto_leave_peak_percent': 50}, 5, True),
+    # Leaves at 40% of the peak at the end. The later counts are above auto_leave_count, but not above the 12
+    # people the rule left at, so this is not early
+    ({'auto_leave_count': 2, 'auto_leave_peak_percent': 40}, 11, False),
+    # Leaves when 15 people left within 3 checks, during the break
+    ({'auto_leave_count': 2, 'auto_leave_drop_count': 15, 'auto_leave_drop_window': 3}, 5, True),
+    # Leaves when 18 people left within 3 checks, at the end
+    ({'auto_leave_count': 2, 'auto_leave_drop_count': 18, 'auto_leave_drop_window': 3}, 11, False),
+])
+def test_simulate_leave(joiner, write_log, settings, leave_index, premature):
+    log = joiner.load_event_log(write_log([card(START - 3600, "maths", START),
+                                           *members("maths", START + 5, BREAK_AND_END)]))
+    meeting = log['meetings'][0]
+    settings = {'auto_leave': True, 'member_interval': 10, **settings}
+    # Every check reads the next count of the trace
+    assert joiner.simulate_leave(log, settings, meeting, START + 10) == (START + 10 + leave_index * 10, premature)
+
+
+def test_simulate_leave_limits(joiner, write_log):
+    log = joiner.load_event_log(write_log([card(START - 3600, "maths", START), *members("maths", START, [20] * 100)]))
+    meeting = log['meetings'][0]
+
+    # Without auto_leave or enough people leaving, the meeting ends or auto_leave_after_min passes
+    assert joiner.simulate_leave(log, {'auto_leave': False}, meeting, START) == (meeting.time_ended, False)
+    assert joiner.simulate_leave(log, {'auto_leave': True}, meeting, START) == (meeting.time_ended, False)
+    assert joiner.simulate_leave(log, {'auto_leave': True, 'auto_leave_after_min': 20}, meeting, START) == \
+        (START + 20 * 60, False)
+
+
+def test_run_simulation(joiner, write_log, capsys):
+    path = write_log([card(START - 3600, "maths", START), *members("maths", START + 5, BREAK_AND_END),
+                      {'t': START, 'event': "join", 'id': "maths", 'latency': 5}])
+    joiner.config['auto_leave'] = True
+    joiner.run_simulation(path, ["auto_leave_peak_percent=0,50", "member_interval=10,20"])
+    out = capsys.readouterr().out
+    assert "Simulated 4 setting(s) for 1 meeting(s)" in out
+    lines = [line for line in out.splitlines() if "joined" in line]
+    assert len(lines) == 4
+    # Settings that left during the break are ranked last
+    assert lines[-1].startswith("auto_leave_peak_percent=50")
+    assert lines[-1].endswith("1 premature leaves")